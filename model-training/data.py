@@ -1,16 +1,41 @@
+import glob
 import json
+import os
 
+import datasets
 import pandas as pd
 from datasets import Dataset, DatasetDict
 from transformers import DataCollatorForLanguageModeling
 
 
-def load_dataset(dataset_file):
-    print(f"Loading dataset from {dataset_file}...")
-    with open(dataset_file, "r") as f:
-        data = json.load(f)
-    dataset = Dataset.from_list(data)
-    return dataset
+DATASET_DIR = "dataset"
+LEGACY_DATASET_FILE = "dataset.json"
+SHARD_PATTERNS = ("train-*.jsonl", "train-*.jsonl.zst")
+
+
+# A directory of JSONL shards from dataset_collector.py is converted once into
+# Arrow files in the datasets cache and memory-mapped from there, so the
+# examples never have to fit in RAM. A single JSON array file is still read
+# with json.load.
+def load_dataset(dataset_path):
+    print(f"Loading dataset from {dataset_path}...")
+    if not os.path.isdir(dataset_path):
+        with open(dataset_path, "r") as f:
+            data = json.load(f)
+        return Dataset.from_list(data)
+
+    shards = sorted(
+        path
+        for pattern in SHARD_PATTERNS
+        for path in glob.glob(os.path.join(dataset_path, pattern))
+    )
+    if not shards:
+        raise FileNotFoundError(f"No training shards found in {dataset_path}")
+    return datasets.load_dataset("json", data_files=shards, split="train")
+
+
+def default_dataset_path():
+    return DATASET_DIR if os.path.isdir(DATASET_DIR) else LEGACY_DATASET_FILE
 
 
 def prepare_datasets(dataset):
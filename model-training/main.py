@@ -1,5 +1,6 @@
 from config import select_model, requires_auth
 from data import (
+    default_dataset_path,
     load_dataset,
     prepare_datasets,
     get_inference_examples,
@@ -27,7 +28,7 @@ def main():
     if requires_auth(model_config.model_name):
         authenticate_huggingface()
 
-    dataset = load_dataset("dataset.json")
+    dataset = load_dataset(default_dataset_path())
     dataset_dict = prepare_datasets(dataset)
     inference_examples = get_inference_examples(dataset_dict)
 
@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+DEFAULT_MIX = "list=30,get=35,search=15,create=10,update=10"
+
+SERVICES = [
+    "mobile voice",
+    "mobile broadband",
+    "fixed line broadband",
+    "PBX",
+    "IoT",
+    "eSim",
+    "invoice",
+    "device delivery",
+    "self-service portal",
+    "webshop",
+]
+SYSTEMS = ["Salesforce", "Online Self-service", "billing", "CRM", "HLR", "DOC API"]
+SYMPTOMS = [
+    "shows 'Something went wrong'",
+    "is not visible",
+    "fails with HTTP 500",
+    "times out",
+    "shows the wrong price",
+    "is missing after the order",
+]
+CATEGORIES = ["Code Issue", "Data Synchronization", "Configuration", "User Error"]
+
+
+# Records follow the Dataset shape of synthetic-data-generation/data_generator.py
+def synthetic_datasets(rng: random.Random) -> Iterator[dict]:
+    while True:
+        service = rng.choice(SERVICES)
+        system = rng.choice(SYSTEMS)
+        subscription = f"SUB{rng.randint(1230000000, 1239999999)}"
+        yield {
+            "issueDescription": f"Customer reports {service} {rng.choice(SYMPTOMS)}. "
+            f"Subscription {subscription}.",
+            "actionsTaken": [
+                f"Verified {subscription} in {system}.",
+                f"Reproduced the issue and escalated to the {system} team.",
+                "Fix deployed to production, verified with the customer.",
+            ],
+            "resolution": f"The {service} issue has been resolved.",
+            "rca": f"RCA Category: {rng.choice(CATEGORIES)}. "
+            f"Faulty {system} integration affecting {service}.",
+        }
+
+
+def generated_datasets(path: str) -> Iterator[dict]:
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT dataset FROM INCIDENTS WHERE dataset IS NOT NULL ORDER BY id"
+        )
+        for (dataset_raw,) in rows:
+            yield from json.loads(dataset_raw)["datasets"]
+    finally:
+        conn.close()
+
+
+def to_incident(dataset: dict) -> dict:
+    actions_taken = dataset["actionsTaken"]
+    if isinstance(actions_taken, list):
+        actions_taken = "\n".join(actions_taken)
+    return {
+        "description": dataset["issueDescription"],
+        "actions_taken": actions_taken,
+        "rca": dataset["rca"],
+        "resolution": dataset["resolution"],
+        "status": "CLOSED",
+    }
+
+
+def seed_records(count: int, datasets_path: Optional[str], seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    source = generated_datasets(datasets_path) if datasets_path else iter(())
+    records = [to_incident(dataset) for _, dataset in zip(range(count), source)]
+    # Top up with synthetic records when the generator store is smaller than N
+    synthetic = synthetic_datasets(rng)
+    while len(records) < count:
+        records.append(to_incident(next(synthetic)))
+    return records
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int) -> dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = int(weight)
+    unknown = set(weights) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, ids: List[int], rng: random.Random):
+        self.client = client
+        self.ids = ids
+        self.rng = rng
+        self.terms = [word for service in SERVICES for word in service.split()]
+
+    async def list(self):
+        return await self.client.get(
+            "/incidents",
+            params={
+                "limit": 50,
+                "fields": "id,description,status",
+                "order_by": self.rng.choice(["id", "-id", "-updated_at"]),
+            },
+        )
+
+    async def get(self):
+        return await self.client.get(f"/incidents/{self.rng.choice(self.ids)}")
+
+    async def search(self):
+        return await self.client.get(
+            "/incidents/search", params={"q": self.rng.choice(self.terms)}
+        )
+
+    async def create(self):
+        return await self.client.post(
+            "/incidents",
+            json={
+                "description": "Benchmark incident",
+                "actions_taken": "Created by the benchmark",
+            },
+        )
+
+    async def update(self):
+        return await self.client.put(
+            f"/incidents/{self.rng.choice(self.ids)}",
+            json={"rca": f"Benchmark RCA {self.rng.random()}"},
+        )
+
+
+OPERATIONS = ("list", "get", "search", "create", "update")
+
+
+async def seed(client: httpx.AsyncClient, records: List[dict]) -> dict:
+    body = "".join(json.dumps(record) + "\n" for record in records)
+    started = time.perf_counter()
+    response = await client.post(
+        "/incidents/bulk",
+        content=body.encode(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    response.raise_for_status()
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": response.json()["inserted"],
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(len(records) / elapsed, 1) if elapsed else None,
+    }
+
+
+async def fetch_ids(client: httpx.AsyncClient) -> List[int]:
+    response = await client.get("/incidents", params={"stream": True, "fields": "id"})
+    response.raise_for_status()
+    return [json.loads(line)["id"] for line in response.text.splitlines() if line]
+
+
+async def run_load(
+    client: httpx.AsyncClient, args: argparse.Namespace, ids: List[int]
+) -> dict:
+    rng = random.Random(args.seed)
+    workload = Workload(client, ids, rng)
+    weights = parse_mix(args.mix)
+    names = list(weights)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            name = rng.choices(names, weights=[weights[n] for n in names])[0]
+            started = time.perf_counter()
+            try:
+                response = await getattr(workload, name)()
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[name].append(time.perf_counter() - started)
+            if failed:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "operations": {
+            name: summarize(latencies[name], errors[name]) for name in sorted(latencies)
+        },
+        "total": {
+            **summarize(all_latencies, sum(errors.values())),
+            "seconds": round(elapsed, 3),
+            "requests_per_second": round(len(all_latencies) / elapsed, 1),
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    records = seed_records(args.incidents, args.datasets, args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60)
+        lifespan = None
+    else:
+        # The app reads its configuration at import time, so it is pointed at
+        # a throwaway database before main is imported.
+        workdir = tempfile.mkdtemp(prefix="incident-benchmark-")
+        os.environ["DATABASE_URL"] = (
+            f"sqlite+aiosqlite:///{os.path.join(workdir, 'incidents.db')}"
+        )
+        if args.cache_size is not None:
+            os.environ["INCIDENT_CACHE_SIZE"] = str(args.cache_size)
+            os.environ["COLLECTION_CACHE_SIZE"] = str(args.cache_size)
+        import main
+
+        lifespan = main.lifespan(main.app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app),
+            base_url="http://benchmark",
+            limits=limits,
+            timeout=60,
+        )
+
+    try:
+        async with client:
+            seeded = await seed(client, records)
+            ids = await fetch_ids(client)
+            results = await run_load(client, args, ids)
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    return {
+        "config": {
+            "target": args.url or "in-process",
+            "incidents": args.incidents,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": parse_mix(args.mix),
+            "cache_size": args.cache_size,
+            "seed": args.seed,
+        },
+        "seed": seeded,
+        **results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test the incident API and report latency percentiles."
+    )
+    parser.add_argument("--incidents", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument(
+        "--url",
+        help="Benchmark a running server (e.g. http://localhost:8000) "
+        "instead of the in-process app on a temporary database",
+    )
+    parser.add_argument(
+        "--datasets",
+        help="Seed from a synthetic-data-generation telco_incidents.db store",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        help="Override the response cache sizes, 0 disables caching",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output, file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
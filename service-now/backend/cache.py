@@ -0,0 +1,125 @@
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional, Tuple
+
+INCIDENT_CACHE_SIZE = int(os.getenv("INCIDENT_CACHE_SIZE", "10000"))
+COLLECTION_CACHE_SIZE = int(os.getenv("COLLECTION_CACHE_SIZE", "256"))
+# Bounds staleness for writes that bypass the API and so the change log
+CACHE_TTL_SECONDS = float(os.getenv("INCIDENT_CACHE_TTL_SECONDS", "60"))
+# Past this many changes since the last sync the whole cache is dropped
+# instead of invalidating the changed incidents one by one
+MAX_SYNC_CHANGES = 1000
+
+CachedBody = Tuple[str, bytes]
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # Weak and strong validators compare equal for GET (RFC 9110 13.1.2)
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+class LRUCache:
+    def __init__(self, max_size: int, ttl: float = CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# Serialized incident JSON keyed by id, plus list and search responses keyed
+# by their query. Collection entries are only valid for the write version they
+# were built at, so any write makes every cached collection stale at once.
+# The cache is per worker process, so before serving from it each request
+# syncs it with the change log, which sees writes made by other processes.
+class IncidentCache:
+    def __init__(self):
+        # A per-process generation keeps ETags from colliding across restarts
+        self.generation = uuid.uuid4().hex[:8]
+        self.version = 0
+        # The last change log sequence the cache was synced with
+        self.seq: Optional[int] = None
+        self.incidents = LRUCache(INCIDENT_CACHE_SIZE)
+        self.collections = LRUCache(COLLECTION_CACHE_SIZE)
+
+    def collection_etag(self, key: str, version: Optional[int] = None) -> str:
+        version = self.version if version is None else version
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        return f'"{self.generation}.{version}.{digest}"'
+
+    def get_incident(self, incident_id: int) -> Optional[CachedBody]:
+        return self.incidents.get(incident_id)
+
+    # Readers pass the version they saw before querying, so a body read
+    # concurrently with a write is returned but never cached.
+    def put_incident(self, incident_id: int, body: bytes, version: int) -> CachedBody:
+        entry = (make_etag(body), body)
+        if version == self.version:
+            self.incidents.put(incident_id, entry)
+        return entry
+
+    def get_collection(self, key: str) -> Optional[CachedBody]:
+        entry = self.collections.get(key)
+        if entry is None or entry[0] != self.version:
+            return None
+        return entry[1]
+
+    def put_collection(self, key: str, body: bytes, version: int) -> CachedBody:
+        entry = (self.collection_etag(key, version), body)
+        if version == self.version:
+            self.collections.put(key, (version, entry))
+        return entry
+
+    def invalidate(self, *incident_ids: int):
+        for incident_id in incident_ids:
+            self.incidents.pop(incident_id)
+        self.version += 1
+
+    def invalidate_all(self):
+        self.incidents.clear()
+        self.collections.clear()
+        self.version += 1
+
+    # Changed ids of None means the changes are unknown and drops everything
+    def sync(self, seq: int, changed_ids: Optional[Iterable[int]]):
+        if changed_ids is None:
+            self.invalidate_all()
+        else:
+            self.invalidate(*changed_ids)
+        self.seq = seq if self.seq is None else max(self.seq, seq)
+
+
+incident_cache = IncidentCache()
@@ -0,0 +1,112 @@
+import asyncio
+from typing import Iterable, List
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import schemas
+from database import is_sqlite
+
+# Arbitrary key of the Postgres advisory lock that orders change log commits
+CHANGE_LOG_LOCK = 0x494E4344
+
+
+# Wakes every waiting change feed subscriber when this process commits a
+# change. Subscribers also re-check the change log on a timeout, which is how
+# changes committed by other worker processes reach them. The waiter is taken
+# before reading the change log so a commit landing between the read and the
+# wait still wakes the subscriber.
+class ChangeFeed:
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def notify(self):
+        self._event.set()
+        self._event = asyncio.Event()
+
+    def waiter(self) -> asyncio.Event:
+        return self._event
+
+    @staticmethod
+    async def wait(waiter: asyncio.Event, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+change_feed = ChangeFeed()
+
+
+# The feed cursor and the incident cache assume that sequence numbers become
+# visible in increasing order. SQLite's single writer guarantees it, but on
+# Postgres two transactions can commit their sequences out of order and a
+# reader that has passed the higher one would never see the lower. There the
+# change log insert takes a transaction scoped lock, held until commit, so
+# change log commits happen one at a time in sequence order. Every writer
+# records its changes just before committing, so the lock is held briefly.
+async def record_changes(
+    db: AsyncSession, incident_ids: Iterable[int], operation: models.ChangeOperation
+):
+    if not is_sqlite():
+        await db.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": CHANGE_LOG_LOCK}
+        )
+    await db.execute(
+        insert(models.IncidentChange),
+        [
+            {"incident_id": incident_id, "operation": operation}
+            for incident_id in incident_ids
+        ],
+    )
+
+
+async def latest_sequence(db: AsyncSession) -> int:
+    result = await db.execute(select(func.max(models.IncidentChange.seq)))
+    return result.scalar() or 0
+
+
+async def changed_incidents(db: AsyncSession, since: int, until: int) -> List[int]:
+    result = await db.execute(
+        select(models.IncidentChange.incident_id)
+        .where(models.IncidentChange.seq > since)
+        .where(models.IncidentChange.seq <= until)
+        .distinct()
+    )
+    return list(result.scalars())
+
+
+async def fetch_changes(
+    db: AsyncSession, since: int, limit: int
+) -> List[schemas.IncidentChange]:
+    # Each change carries the incident as it is now, so a consumer that falls
+    # behind sees the latest state for every change it replays.
+    result = await db.execute(
+        select(models.IncidentChange, models.Incident)
+        .outerjoin(
+            models.Incident, models.Incident.id == models.IncidentChange.incident_id
+        )
+        .where(models.IncidentChange.seq > since)
+        .order_by(models.IncidentChange.seq)
+        .limit(limit)
+    )
+    return [
+        schemas.IncidentChange(
+            seq=change.seq,
+            incident_id=change.incident_id,
+            operation=change.operation,
+            changed_at=change.changed_at,
+            incident=schemas.Incident.model_validate(incident) if incident else None,
+        )
+        for change, incident in result.all()
+    ]
+
+
+def format_event(change: schemas.IncidentChange) -> str:
+    return (
+        f"id: {change.seq}\n"
+        f"event: {change.operation.value}\n"
+        f"data: {change.model_dump_json()}\n\n"
+    )
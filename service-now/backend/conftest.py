@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+import pytest
+
+# The engine is created on import, so the database is chosen before main loads.
+# Every test module shares this database and works only on the rows it adds.
+_directory = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_directory.name}/incidents.db"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+def insert_incidents(client: TestClient, count: int, prefix: str = "Incident") -> list:
+    latest = client.get("/incidents", params={"order_by": "-id", "limit": 1}).json()
+    after = latest["items"][0]["id"] if latest["items"] else 0
+    response = client.post(
+        "/incidents/bulk",
+        json=[
+            {"description": f"{prefix} {index}", "actions_taken": "None"}
+            for index in range(count)
+        ],
+    )
+    response.raise_for_status()
+    return list(range(after + 1, after + count + 1))
@@ -1,16 +1,49 @@
-from typing import List
+import base64
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Tuple
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import ValidationError
+from sqlalchemy import insert, literal, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
+import metrics
+import migrations
+from changes import (
+    change_feed,
+    changed_incidents,
+    fetch_changes,
+    format_event,
+    latest_sequence,
+    record_changes,
+)
+from cache import MAX_SYNC_CHANGES, etag_matches, incident_cache
 import models
 import schemas
-from database import engine, get_db
+import search
+from database import SessionLocal, engine, get_db, is_sqlite
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with engine.begin() as conn:
+        if is_sqlite():
+            await conn.run_sync(migrations.migrate_sqlite)
+        await conn.run_sync(models.Base.metadata.create_all)
+        if is_sqlite():
+            await conn.run_sync(search.create_search_index)
+    yield
+    await engine.dispose()
 
-models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+metrics.instrument_engine(engine.sync_engine)
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,54 +51,488 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 
-@app.get("/incidents", response_model=List[schemas.Incident])
-def get_incidents(db: Session = Depends(get_db)):
-    incidents = db.query(models.Incident).all()
-    return incidents
+INCIDENT_FIELDS = (
+    "id",
+    "description",
+    "actions_taken",
+    "rca",
+    "resolution",
+    "status",
+    "created_at",
+    "updated_at",
+)
+ORDER_FIELDS = ("id", "created_at", "updated_at")
+STREAM_BATCH_SIZE = 500
+BULK_BATCH_SIZE = 1000
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl")
+SSE_HEARTBEAT_SECONDS = 15.0
 
 
-@app.get("/incidents/{incident_id}", response_model=schemas.Incident)
-def get_incident(incident_id: int, db: Session = Depends(get_db)):
-    incident = (
-        db.query(models.Incident).filter(models.Incident.id == incident_id).first()
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def collection_key(name: str, request: Request) -> str:
+    params = sorted(request.query_params.multi_items())
+    return name + "?" + "&".join(f"{key}={value}" for key, value in params)
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"}
+        )
+    return None
+
+
+def cached_response(request: Request, entry) -> Response:
+    etag, body = entry
+    return not_modified(request, etag) or Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
     )
-    if incident is None:
-        raise HTTPException(status_code=404, detail="Incident not found")
-    return incident
+
+
+# Catches the cache up with the change log before anything is served from it,
+# so writes committed through other worker processes are never served stale.
+# The max of the sequence is a single primary key lookup.
+async def sync_cache(db: AsyncSession):
+    seq = await latest_sequence(db)
+    since = incident_cache.seq
+    if since is not None and seq <= since:
+        return
+    changed_ids = None
+    if since is not None and seq - since <= MAX_SYNC_CHANGES:
+        changed_ids = await changed_incidents(db, since, seq)
+    incident_cache.sync(seq, changed_ids)
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(INCIDENT_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in INCIDENT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    # id is always returned, clients need it as the keyset cursor
+    return ["id"] + [field for field in requested if field != "id"]
+
+
+def parse_order(order_by: str) -> Tuple[str, bool]:
+    descending = order_by.startswith("-")
+    field = order_by.lstrip("-")
+    if field not in ORDER_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"order_by must be one of {', '.join(ORDER_FIELDS)}, "
+            "optionally prefixed with '-' for descending order",
+        )
+    return field, descending
+
+
+def encode_cursor(row: dict, order_field: str) -> str:
+    position = json.dumps([row[order_field], row["id"]], default=json_default)
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str, order_field: str) -> Tuple[Any, int]:
+    try:
+        value, incident_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if order_field != "id":
+            value = datetime.fromisoformat(value)
+        return value, int(incident_id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+def to_utc(value: datetime) -> datetime:
+    # Timestamps are stored as naive UTC (SQLite CURRENT_TIMESTAMP)
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def incident_select(
+    columns: List[str],
+    order_field: str = "id",
+    descending: bool = False,
+    cursor: Optional[Tuple[Any, int]] = None,
+    status: Optional[List[schemas.StatusEnum]] = None,
+    since: Optional[datetime] = None,
+):
+    selected = columns if order_field in columns else columns + [order_field]
+    query = select(*[getattr(models.Incident, column) for column in selected])
+    if status:
+        query = query.where(models.Incident.status.in_(status))
+    if since is not None:
+        query = query.where(models.Incident.updated_at >= to_utc(since))
+
+    order_column = getattr(models.Incident, order_field)
+    if order_field == "id":
+        position = models.Incident.id
+        bound = cursor[1] if cursor else None
+        ordering = [models.Incident.id]
+    else:
+        position = tuple_(order_column, models.Incident.id)
+        # Tuple elements are not typed from the other side of the comparison,
+        # so the timestamp is bound with the column type and stored format
+        bound = (
+            tuple_(literal(to_utc(cursor[0]), order_column.type), cursor[1])
+            if cursor
+            else None
+        )
+        ordering = [order_column, models.Incident.id]
+    if cursor is not None:
+        query = query.where(position < bound if descending else position > bound)
+    if descending:
+        ordering = [column.desc() for column in ordering]
+    return query.order_by(*ordering)
+
+
+async def stream_incidents(columns: List[str], **filters):
+    # The request scoped session is closed before the body is streamed,
+    # so the generator owns its own session for the lifetime of the cursor.
+    async with SessionLocal() as db:
+        result = await db.stream(
+            incident_select(columns, **filters).execution_options(
+                yield_per=STREAM_BATCH_SIZE
+            )
+        )
+        async for row in result:
+            item = {column: row._mapping[column] for column in columns}
+            yield json.dumps(item, default=json_default) + "\n"
+
+
+@app.get(
+    "/incidents",
+    response_model=schemas.IncidentPage,
+    response_model_exclude_unset=True,
+)
+async def get_incidents(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    fields: Optional[str] = None,
+    status: Optional[List[schemas.StatusEnum]] = Query(default=None),
+    since: Optional[datetime] = None,
+    order_by: str = "id",
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    columns = parse_fields(fields)
+    order_field, descending = parse_order(order_by)
+    filters = {
+        "order_field": order_field,
+        "descending": descending,
+        "cursor": decode_cursor(cursor, order_field) if cursor else None,
+        "status": status,
+        "since": since,
+    }
+    if stream:
+        return StreamingResponse(
+            stream_incidents(columns, **filters), media_type="application/x-ndjson"
+        )
+
+    await sync_cache(db)
+    key = collection_key("list", request)
+    version = incident_cache.version
+    response = not_modified(request, incident_cache.collection_etag(key, version))
+    if response is not None:
+        return response
+    entry = incident_cache.get_collection(key)
+    if entry is None:
+        result = await db.execute(incident_select(columns, **filters).limit(limit + 1))
+        rows = [dict(row._mapping) for row in result.all()]
+        next_cursor = (
+            encode_cursor(rows[limit - 1], order_field) if len(rows) > limit else None
+        )
+        items = [{column: row[column] for column in columns} for row in rows[:limit]]
+        page = schemas.IncidentPage(items=items, next_cursor=next_cursor)
+        with metrics.serialization_timer("/incidents"):
+            body = page.model_dump_json(exclude_unset=True).encode()
+        entry = incident_cache.put_collection(key, body, version)
+    return cached_response(request, entry)
+
+
+@app.get("/incidents/search", response_model=schemas.IncidentSearchPage)
+async def search_incidents(
+    request: Request,
+    q: str = Query(min_length=1),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    db: AsyncSession = Depends(get_db),
+):
+    if not is_sqlite():
+        raise HTTPException(
+            status_code=501, detail="Full-text search requires the SQLite backend"
+        )
+    match_query = search.build_match_query(q)
+    if not match_query:
+        return {"items": [], "next_offset": None}
+
+    await sync_cache(db)
+    key = collection_key("search", request)
+    version = incident_cache.version
+    response = not_modified(request, incident_cache.collection_etag(key, version))
+    if response is not None:
+        return response
+    entry = incident_cache.get_collection(key)
+    if entry is None:
+        result = await db.execute(
+            text(search.SEARCH_QUERY),
+            {"query": match_query, "limit": limit + 1, "offset": offset},
+        )
+        rows = result.all()
+        items = [dict(row._mapping) for row in rows[:limit]]
+        next_offset = offset + limit if len(rows) > limit else None
+        page = schemas.IncidentSearchPage(items=items, next_offset=next_offset)
+        with metrics.serialization_timer("/incidents/search"):
+            body = page.model_dump_json().encode()
+        entry = incident_cache.put_collection(key, body, version)
+    return cached_response(request, entry)
+
+
+async def stream_changes(request: Request, since: int, limit: int):
+    yield "retry: 3000\n\n"
+    while not await request.is_disconnected():
+        waiter = change_feed.waiter()
+        async with SessionLocal() as db:
+            changes = await fetch_changes(db, since, limit)
+        for change in changes:
+            yield format_event(change)
+            since = change.seq
+        if len(changes) < limit:
+            if not await change_feed.wait(waiter, SSE_HEARTBEAT_SECONDS):
+                yield ": keep-alive\n\n"
+
+
+@app.get("/incidents/changes", response_model=schemas.IncidentChangePage)
+async def get_incident_changes(
+    request: Request,
+    since: Optional[int] = Query(default=None, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    timeout: float = Query(default=25.0, ge=0, le=60),
+    db: AsyncSession = Depends(get_db),
+):
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    if since is None:
+        # Without a cursor the feed starts at the tail and only sends new changes
+        since = await latest_sequence(db)
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            stream_changes(request, since, limit),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    waiter = change_feed.waiter()
+    changes = await fetch_changes(db, since, limit)
+    if not changes and timeout:
+        # Hand the connection back to the pool while the long poll is parked
+        await db.rollback()
+        await change_feed.wait(waiter, timeout)
+        changes = await fetch_changes(db, since, limit)
+    next_since = changes[-1].seq if changes else since
+    return {"items": changes, "next_since": next_since}
+
+
+@app.get("/incidents/{incident_id}", response_model=schemas.Incident)
+async def get_incident(
+    incident_id: int, request: Request, db: AsyncSession = Depends(get_db)
+):
+    await sync_cache(db)
+    entry = incident_cache.get_incident(incident_id)
+    if entry is None:
+        version = incident_cache.version
+        incident = await db.get(models.Incident, incident_id)
+        if incident is None:
+            raise HTTPException(status_code=404, detail="Incident not found")
+        with metrics.serialization_timer("/incidents/{incident_id}"):
+            body = schemas.Incident.model_validate(incident).model_dump_json().encode()
+        entry = incident_cache.put_incident(incident_id, body, version)
+    return cached_response(request, entry)
 
 
 @app.post("/incidents", response_model=schemas.Incident, status_code=201)
-def create_incident(incident: schemas.IncidentCreate, db: Session = Depends(get_db)):
+async def create_incident(
+    incident: schemas.IncidentCreate, db: AsyncSession = Depends(get_db)
+):
     db_incident = models.Incident(
         description=incident.description,
         actions_taken=incident.actions_taken,
         status=models.StatusEnum.OPEN,
     )
     db.add(db_incident)
-    db.commit()
-    db.refresh(db_incident)
+    await db.flush()
+    await record_changes(db, [db_incident.id], models.ChangeOperation.CREATED)
+    await db.commit()
+    incident_cache.invalidate()
+    change_feed.notify()
+    await db.refresh(db_incident)
     return db_incident
 
 
+async def iter_ndjson(request: Request):
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def iter_json_array(request: Request):
+    try:
+        records = json.loads(await request.body())
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array")
+    for record in records:
+        yield record
+
+
+async def insert_batch(db: AsyncSession, batch: List[dict]):
+    # A list of parameter sets makes SQLAlchemy run a single executemany,
+    # and each batch is its own transaction so the write lock is released
+    # regularly during long imports.
+    result = await db.execute(
+        insert(models.Incident).returning(models.Incident.id), batch
+    )
+    await record_changes(db, result.scalars().all(), models.ChangeOperation.CREATED)
+    await db.commit()
+    incident_cache.invalidate()
+    change_feed.notify()
+
+
+@app.post("/incidents/bulk", response_model=schemas.BulkInsertResult, status_code=201)
+async def bulk_create_incidents(request: Request, db: AsyncSession = Depends(get_db)):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in NDJSON_MEDIA_TYPES:
+        records = iter_ndjson(request)
+        validate = schemas.IncidentImport.model_validate_json
+    else:
+        records = iter_json_array(request)
+        validate = schemas.IncidentImport.model_validate
+
+    inserted = 0
+    batch = []
+    index = 0
+    async for record in records:
+        try:
+            incident = validate(record)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=422,
+                detail={
+                    "index": index,
+                    "errors": e.errors(include_url=False, include_input=False),
+                    "inserted": inserted,
+                },
+            )
+        batch.append(incident.model_dump(mode="json"))
+        index += 1
+        if len(batch) >= BULK_BATCH_SIZE:
+            await insert_batch(db, batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        await insert_batch(db, batch)
+        inserted += len(batch)
+    return {"inserted": inserted}
+
+
+@app.patch("/incidents", response_model=schemas.IncidentBatchResponse)
+async def batch_update_incidents(
+    batch: schemas.IncidentBatchUpdate, db: AsyncSession = Depends(get_db)
+):
+    if batch.items is not None:
+        requested = [item.id for item in batch.items]
+        result = await db.execute(
+            select(models.Incident.id).where(models.Incident.id.in_(requested))
+        )
+        existing = set(result.scalars())
+        rows = [
+            {"id": item.id, **item.model_dump(exclude_unset=True, mode="json")}
+            for item in batch.items
+            if item.id in existing
+        ]
+        if rows:
+            # Rows keyed by primary key run as one executemany UPDATE
+            await db.execute(update(models.Incident), rows)
+        updated_ids = [row["id"] for row in rows]
+        results = [
+            {
+                "id": incident_id,
+                "result": "updated" if incident_id in existing else "not_found",
+            }
+            for incident_id in requested
+        ]
+    else:
+        query = update(models.Incident).values(
+            **batch.update.model_dump(exclude_unset=True, mode="json")
+        )
+        if batch.filter.ids:
+            query = query.where(models.Incident.id.in_(batch.filter.ids))
+        if batch.filter.status:
+            query = query.where(models.Incident.status.in_(batch.filter.status))
+        result = await db.execute(
+            query.returning(models.Incident.id),
+            execution_options={"synchronize_session": False},
+        )
+        updated_ids = list(result.scalars())
+        results = [
+            {"id": incident_id, "result": "updated"} for incident_id in updated_ids
+        ]
+
+    if updated_ids:
+        await record_changes(db, updated_ids, models.ChangeOperation.UPDATED)
+    await db.commit()
+    incident_cache.invalidate(*updated_ids)
+    change_feed.notify()
+    return {"updated": len(updated_ids), "results": results}
+
+
 @app.put("/incidents/{incident_id}", response_model=schemas.Incident)
-def update_incident(
-    incident_id: int, incident: schemas.IncidentUpdate, db: Session = Depends(get_db)
+async def update_incident(
+    incident_id: int,
+    incident: schemas.IncidentUpdate,
+    db: AsyncSession = Depends(get_db),
 ):
-    db_incident = (
-        db.query(models.Incident).filter(models.Incident.id == incident_id).first()
-    )
+    db_incident = await db.get(models.Incident, incident_id)
     if db_incident is None:
         raise HTTPException(status_code=404, detail="Incident not found")
 
     for key, value in incident.dict(exclude_unset=True).items():
         setattr(db_incident, key, value)
 
-    db.commit()
-    db.refresh(db_incident)
+    await record_changes(db, [incident_id], models.ChangeOperation.UPDATED)
+    await db.commit()
+    incident_cache.invalidate(incident_id)
+    change_feed.notify()
+    await db.refresh(db_incident)
     return db_incident
 
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 # fastapi run main.py
@@ -0,0 +1,129 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+slow_query_logger = logging.getLogger("incidents.slow_query")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served")
+DB_QUERIES = Histogram(
+    "db_queries_per_request",
+    "Database queries executed per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50),
+)
+DB_TIME = Histogram(
+    "db_query_duration_seconds_per_request",
+    "Time spent in database queries per request",
+    ["route"],
+)
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Database query latency")
+SLOW_QUERIES = Counter("db_slow_queries_total", "Queries slower than SLOW_QUERY_MS")
+SERIALIZATION_TIME = Histogram(
+    "serialization_duration_seconds",
+    "Time spent serializing response bodies",
+    ["route"],
+)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+# The stats object is shared by reference, so SQLAlchemy's greenlets running a
+# copy of the request context still update the request's own counters.
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def instrument_engine(engine: Engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_LATENCY.observe(elapsed)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            SLOW_QUERIES.inc()
+            slow_query_logger.warning(
+                "Slow query (%.1f ms, executemany=%s): %s",
+                elapsed * 1000,
+                many,
+                " ".join(statement.split()),
+            )
+
+
+@contextmanager
+def serialization_timer(route: str):
+    started = time.perf_counter()
+    yield
+    SERIALIZATION_TIME.labels(route).observe(time.perf_counter() - started)
+
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    # Unmatched paths share a label so scanners cannot blow up cardinality
+    return route.path if route is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+        event_stream = False
+
+        async def send_wrapper(message):
+            nonlocal status, event_stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = dict(message.get("headers", []))
+                content_type = headers.get(b"content-type", b"")
+                event_stream = content_type.startswith(b"text/event-stream")
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            request_stats.reset(token)
+            route = route_label(scope)
+            # Change feed streams stay open for minutes and would swamp the
+            # latency histogram, their queries are still counted per query.
+            if not event_stream:
+                REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(
+                    time.perf_counter() - started
+                )
+                DB_QUERIES.labels(route).observe(stats.queries)
+                DB_TIME.labels(route).observe(stats.query_seconds)
@@ -0,0 +1,53 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+import models
+import search
+
+TABLE = models.Incident.__tablename__
+LEGACY_TABLE = f"{TABLE}_legacy"
+STATUS_VALUES = ", ".join(f"'{status.value}'" for status in models.StatusEnum)
+
+
+# Upgrades incidents.db files created before the timestamp columns and the
+# status check constraint. SQLite can add neither through ALTER TABLE, so the
+# table is rebuilt from the current model and rows are copied with their ids.
+def migrate_sqlite(conn: Connection):
+    inspector = inspect(conn)
+    if not inspector.has_table(TABLE):
+        return
+    columns = {column["name"] for column in inspector.get_columns(TABLE)}
+    if "created_at" in columns:
+        return
+
+    print(f"Migrating {TABLE} table to the current schema...")
+    for index in inspector.get_indexes(TABLE):
+        conn.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+    conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}"))
+    models.Incident.__table__.create(conn)
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO {TABLE}
+                (id, description, actions_taken, rca, resolution, status)
+            SELECT
+                id, description, actions_taken, rca, resolution,
+                CASE
+                    WHEN upper(replace(status, ' ', '_')) IN ({STATUS_VALUES})
+                    THEN upper(replace(status, ' ', '_'))
+                    ELSE 'OPEN'
+                END
+            FROM {LEGACY_TABLE}
+            """
+        )
+    )
+    # Dropping the legacy table also drops the search triggers that followed
+    # it through the rename, they are recreated by search.create_search_index.
+    conn.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+    if inspector.has_table(search.SEARCH_TABLE):
+        conn.execute(
+            text(
+                f"INSERT INTO {search.SEARCH_TABLE}({search.SEARCH_TABLE}) "
+                "VALUES ('rebuild')"
+            )
+        )
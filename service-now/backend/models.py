@@ -1,9 +1,23 @@
 import enum
 
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, DateTime, Enum, Index, Integer, String, func
+from sqlalchemy.dialects import sqlite
 
 from database import Base
 
+# SQLite stores timestamps as text and compares them as strings. The server
+# default CURRENT_TIMESTAMP writes whole seconds, so bound values are written
+# in that format too, otherwise a keyset cursor or `since` value would sort
+# after the stored timestamp it was read from.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        timezone=True,
+        storage_format="%(year)04d-%(month)02d-%(day)02d "
+        "%(hour)02d:%(minute)02d:%(second)02d",
+    ),
+    "sqlite",
+)
+
 
 class StatusEnum(str, enum.Enum):
     OPEN = "OPEN"
@@ -11,6 +25,11 @@ class StatusEnum(str, enum.Enum):
     CLOSED = "CLOSED"
 
 
+class ChangeOperation(str, enum.Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+
+
 class Incident(Base):
     __tablename__ = "INCIDENT"
 
@@ -19,4 +38,49 @@ class Incident(Base):
     actions_taken = Column(String, nullable=False)
     rca = Column(String, nullable=True)
     resolution = Column(String, nullable=True)
-    status = Column(String, default=StatusEnum.OPEN)
+    status = Column(
+        Enum(
+            StatusEnum,
+            name="incident_status",
+            native_enum=False,
+            create_constraint=True,
+            validate_strings=True,
+            length=16,
+        ),
+        nullable=False,
+        default=StatusEnum.OPEN,
+    )
+    created_at = Column(Timestamp, nullable=False, server_default=func.now())
+    updated_at = Column(
+        Timestamp,
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+    # id is the keyset tie-breaker, so every ordering index ends with it
+    __table_args__ = (
+        Index("ix_INCIDENT_status_updated_at", "status", "updated_at", "id"),
+        Index("ix_INCIDENT_updated_at", "updated_at", "id"),
+        Index("ix_INCIDENT_created_at", "created_at", "id"),
+    )
+
+
+class IncidentChange(Base):
+    __tablename__ = "INCIDENT_CHANGE"
+
+    # The sequence is the resumable cursor of the change feed
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    incident_id = Column(Integer, nullable=False, index=True)
+    operation = Column(
+        Enum(
+            ChangeOperation,
+            name="incident_change_operation",
+            native_enum=False,
+            create_constraint=True,
+            values_callable=lambda operations: [op.value for op in operations],
+            length=16,
+        ),
+        nullable=False,
+    )
+    changed_at = Column(Timestamp, nullable=False, server_default=func.now())
@@ -1,7 +1,9 @@
+from collections import Counter
+from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 
 class StatusEnum(str, Enum):
@@ -19,17 +21,127 @@ class IncidentCreate(IncidentBase):
     pass
 
 
+class IncidentImport(IncidentBase):
+    rca: Optional[str] = None
+    resolution: Optional[str] = None
+    status: StatusEnum = StatusEnum.OPEN
+
+
+class BulkInsertResult(BaseModel):
+    inserted: int
+
+
 class IncidentUpdate(BaseModel):
     rca: Optional[str] = None
     resolution: Optional[str] = None
     status: Optional[StatusEnum] = None
 
 
+class IncidentBatchItem(IncidentUpdate):
+    id: int
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if not self.model_fields_set - {"id"}:
+            raise ValueError("Item must set at least one of rca, resolution, status")
+        return self
+
+
+class IncidentFilter(BaseModel):
+    ids: Optional[List[int]] = Field(default=None, max_length=5000)
+    status: Optional[List[StatusEnum]] = None
+
+
+class IncidentBatchUpdate(BaseModel):
+    items: Optional[List[IncidentBatchItem]] = Field(default=None, max_length=5000)
+    filter: Optional[IncidentFilter] = None
+    update: Optional[IncidentUpdate] = None
+
+    @model_validator(mode="after")
+    def check_mode(self):
+        if (self.items is None) == (self.filter is None):
+            raise ValueError("Provide either items or filter with update")
+        if self.items is not None:
+            # Each id is one row changed, one result and one change log entry
+            counts = Counter(item.id for item in self.items)
+            duplicates = sorted(id_ for id_, count in counts.items() if count > 1)
+            if duplicates:
+                raise ValueError(f"Duplicate item ids: {duplicates}")
+        if self.filter is not None:
+            if self.update is None or not self.update.model_fields_set:
+                raise ValueError("filter requires a non-empty update")
+            if not self.filter.ids and not self.filter.status:
+                raise ValueError("filter must restrict ids or status")
+        return self
+
+
+class IncidentBatchResult(BaseModel):
+    id: int
+    result: Literal["updated", "not_found"]
+
+
+class IncidentBatchResponse(BaseModel):
+    updated: int
+    results: List[IncidentBatchResult]
+
+
 class Incident(IncidentBase):
     id: int
     rca: Optional[str] = None
     resolution: Optional[str] = None
     status: StatusEnum
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class IncidentPartial(BaseModel):
+    id: int
+    description: Optional[str] = None
+    actions_taken: Optional[str] = None
+    rca: Optional[str] = None
+    resolution: Optional[str] = None
+    status: Optional[StatusEnum] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
+
+
+class IncidentPage(BaseModel):
+    items: List[IncidentPartial]
+    next_cursor: Optional[str] = None
+
+
+class ChangeOperation(str, Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+
+
+class IncidentChange(BaseModel):
+    seq: int
+    incident_id: int
+    operation: ChangeOperation
+    changed_at: datetime
+    incident: Optional[Incident] = None
+
+
+class IncidentChangePage(BaseModel):
+    items: List[IncidentChange]
+    next_since: int
+
+
+class IncidentSearchHit(BaseModel):
+    id: int
+    description: str
+    status: StatusEnum
+    snippet: str
+    rank: float
+
+
+class IncidentSearchPage(BaseModel):
+    items: List[IncidentSearchHit]
+    next_offset: Optional[int] = None
@@ -0,0 +1,85 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+SEARCH_TABLE = "INCIDENT_FTS"
+SEARCH_COLUMNS = ("description", "actions_taken", "rca", "resolution")
+# bm25 weights follow SEARCH_COLUMNS, matches in the description rank highest
+SEARCH_WEIGHTS = (4.0, 1.0, 2.0, 2.0)
+
+_columns = ", ".join(SEARCH_COLUMNS)
+_new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+_old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+
+CREATE_SEARCH_TABLE = f"""
+CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+    {_columns},
+    content='INCIDENT',
+    content_rowid='id',
+    tokenize='porter unicode61'
+)
+"""
+
+CREATE_SEARCH_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON INCIDENT BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON INCIDENT BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_columns})
+        VALUES ('delete', old.id, {_old_values});
+    END
+    """,
+    # Only text edits touch the index, status changes leave it alone
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au
+    AFTER UPDATE OF {_columns} ON INCIDENT BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_columns})
+        VALUES ('delete', old.id, {_old_values});
+        INSERT INTO {SEARCH_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END
+    """,
+]
+
+SEARCH_QUERY = f"""
+SELECT
+    INCIDENT.id AS id,
+    INCIDENT.description AS description,
+    INCIDENT.status AS status,
+    snippet({SEARCH_TABLE}, -1, '[', ']', '...', 16) AS snippet,
+    bm25({SEARCH_TABLE}, {", ".join(str(weight) for weight in SEARCH_WEIGHTS)}) AS rank
+FROM {SEARCH_TABLE}
+JOIN INCIDENT ON INCIDENT.id = {SEARCH_TABLE}.rowid
+WHERE {SEARCH_TABLE} MATCH :query
+ORDER BY rank
+LIMIT :limit OFFSET :offset
+"""
+
+
+def create_search_index(conn: Connection):
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": SEARCH_TABLE},
+    ).first()
+    if not exists:
+        conn.execute(text(CREATE_SEARCH_TABLE))
+        # Index the rows that were already in the table before FTS was enabled
+        conn.execute(
+            text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+        )
+    # Dropped and recreated so databases built with older trigger definitions
+    # pick up the current ones
+    for suffix in ("ai", "ad", "au"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{suffix}"))
+    for trigger in CREATE_SEARCH_TRIGGERS:
+        conn.execute(text(trigger))
+
+
+def build_match_query(query: str) -> str:
+    # Quote every term so user input can never be parsed as FTS5 syntax,
+    # and prefix match the last term so results update while typing.
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
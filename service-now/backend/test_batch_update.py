@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import insert_incidents
+
+
+@pytest.fixture(scope="module")
+def incident_ids(client):
+    return insert_incidents(client, 3, "Batch update")
+
+
+def test_items_with_duplicate_ids_are_rejected(client, incident_ids):
+    first = incident_ids[0]
+    response = client.patch(
+        "/incidents",
+        json={
+            "items": [
+                {"id": first, "status": "CLOSED"},
+                {"id": first, "rca": "Duplicate"},
+            ]
+        },
+    )
+    assert response.status_code == 422
+    assert f"Duplicate item ids: [{first}]" in response.json()["detail"][0]["msg"]
+    assert client.get(f"/incidents/{first}").json()["status"] == "OPEN"
+
+
+def test_items_report_unknown_ids(client, incident_ids):
+    known, unknown = incident_ids[1], incident_ids[-1] + 1000
+    response = client.patch(
+        "/incidents",
+        json={
+            "items": [
+                {"id": known, "status": "IN_PROGRESS", "rca": "Disk full"},
+                {"id": unknown, "status": "CLOSED"},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "updated": 1,
+        "results": [
+            {"id": known, "result": "updated"},
+            {"id": unknown, "result": "not_found"},
+        ],
+    }
+    incident = client.get(f"/incidents/{known}").json()
+    assert (incident["status"], incident["rca"]) == ("IN_PROGRESS", "Disk full")
+
+
+def test_filter_updates_matching_incidents(client):
+    incident_ids = insert_incidents(client, 3, "Batch filter")
+    response = client.patch(
+        "/incidents",
+        json={
+            "filter": {"ids": incident_ids[:2], "status": ["OPEN"]},
+            "update": {"status": "CLOSED"},
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["updated"] == 2
+    statuses = [
+        client.get(f"/incidents/{incident_id}").json()["status"]
+        for incident_id in incident_ids
+    ]
+    assert statuses == ["CLOSED", "CLOSED", "OPEN"]
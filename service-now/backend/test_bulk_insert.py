@@ -0,0 +1,46 @@
+import json
+
+import main
+
+
+def test_bulk_insert_counts_inserted_incidents(client):
+    response = client.post(
+        "/incidents/bulk",
+        json=[
+            {"description": "Bulk", "actions_taken": "None", "status": "CLOSED"},
+            {"description": "Bulk", "actions_taken": "None"},
+        ],
+    )
+    assert response.status_code == 201
+    assert response.json() == {"inserted": 2}
+
+
+def test_invalid_record_reports_index_and_inserted(client, monkeypatch):
+    # Small batches, so some records are committed before the invalid one
+    monkeypatch.setattr(main, "BULK_BATCH_SIZE", 2)
+    records = [
+        {"description": f"Bulk {index}", "actions_taken": "None"} for index in range(5)
+    ]
+    del records[3]["actions_taken"]
+    response = client.post("/incidents/bulk", json=records)
+    assert response.status_code == 422
+    detail = response.json()["detail"]
+    assert (detail["index"], detail["inserted"]) == (3, 2)
+    assert detail["errors"][0]["loc"] == ["actions_taken"]
+
+
+def test_invalid_ndjson_line_reports_index(client):
+    lines = [
+        json.dumps({"description": "NDJSON", "actions_taken": "None"}),
+        json.dumps(
+            {"description": "NDJSON", "actions_taken": "None", "status": "DONE"}
+        ),
+    ]
+    response = client.post(
+        "/incidents/bulk",
+        content="\n".join(lines) + "\n",
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 422
+    detail = response.json()["detail"]
+    assert (detail["index"], detail["inserted"]) == (1, 0)
@@ -0,0 +1,35 @@
+import pytest
+
+from conftest import insert_incidents
+
+
+@pytest.fixture(scope="module")
+def incident_id(client):
+    return insert_incidents(client, 1, "Cached")[0]
+
+
+def test_matching_etag_returns_304(client, incident_id):
+    response = client.get(f"/incidents/{incident_id}")
+    etag = response.headers["ETag"]
+    cached = client.get(f"/incidents/{incident_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+
+
+def test_collection_etag_returns_304(client):
+    params = {"fields": "id", "limit": 10}
+    etag = client.get("/incidents", params=params).headers["ETag"]
+    cached = client.get(
+        "/incidents", params=params, headers={"If-None-Match": f'W/{etag}, "other"'}
+    )
+    assert cached.status_code == 304
+
+
+def test_update_changes_the_etag(client, incident_id):
+    etag = client.get(f"/incidents/{incident_id}").headers["ETag"]
+    client.put(f"/incidents/{incident_id}", json={"rca": "Expired certificate"})
+    response = client.get(f"/incidents/{incident_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["rca"] == "Expired certificate"
@@ -0,0 +1,30 @@
+from conftest import insert_incidents
+
+
+def test_change_feed_returns_a_patch(client):
+    incident_id = insert_incidents(client, 1, "Change feed")[0]
+    # Without a cursor the feed starts at the tail
+    tail = client.get("/incidents/changes", params={"timeout": 0}).json()
+    assert tail["items"] == []
+
+    response = client.patch(
+        "/incidents", json={"items": [{"id": incident_id, "status": "CLOSED"}]}
+    )
+    assert response.status_code == 200
+
+    page = client.get(
+        "/incidents/changes", params={"since": tail["next_since"], "timeout": 0}
+    ).json()
+    assert [(item["incident_id"], item["operation"]) for item in page["items"]] == [
+        (incident_id, "updated")
+    ]
+    change = page["items"][0]
+    assert change["incident"]["status"] == "CLOSED"
+    assert page["next_since"] == change["seq"] > tail["next_since"]
+
+    # Resuming from the returned cursor finds nothing new
+    resumed = client.get(
+        "/incidents/changes", params={"since": page["next_since"], "timeout": 0}
+    ).json()
+    assert resumed["items"] == []
+    assert resumed["next_since"] == page["next_since"]
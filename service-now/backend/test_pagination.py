@@ -0,0 +1,57 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import insert_incidents
+
+INCIDENTS = 25
+PAGE_SIZE = 5
+
+
+@pytest.fixture(scope="module")
+def incident_ids(client):
+    # One bulk insert, so every row shares the same created_at/updated_at
+    return insert_incidents(client, INCIDENTS)
+
+
+def fetch_all(client: TestClient, order_by: str) -> list:
+    rows = []
+    cursor = None
+    # Caps the pages, so a repeating cursor fails the test instead of hanging
+    for _ in range(1000):
+        params = {
+            "limit": PAGE_SIZE,
+            "order_by": order_by,
+            "fields": "created_at,updated_at",
+        }
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/incidents", params=params).json()
+        rows.extend(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return rows
+    pytest.fail(f"order_by={order_by} did not finish paging")
+
+
+@pytest.mark.parametrize(
+    "order_by", ["created_at", "-created_at", "updated_at", "-updated_at"]
+)
+def test_timestamp_keyset_pages_rows_sharing_a_timestamp(
+    client, incident_ids, order_by
+):
+    rows = fetch_all(client, order_by)
+    field = order_by.lstrip("-")
+    expected = sorted(rows, key=lambda row: (row[field], row["id"]))
+    if order_by.startswith("-"):
+        expected.reverse()
+    assert [row["id"] for row in rows] == [row["id"] for row in expected]
+    assert len({row["id"] for row in rows}) == len(rows)
+    assert set(incident_ids) <= {row["id"] for row in rows}
+
+
+def test_since_includes_rows_at_the_timestamp(client, incident_ids):
+    updated_at = client.get(f"/incidents/{incident_ids[0]}").json()["updated_at"]
+    page = client.get(
+        "/incidents", params={"since": updated_at, "limit": 1000, "fields": "id"}
+    ).json()
+    assert set(incident_ids) <= {item["id"] for item in page["items"]}
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useMemo } from "react";
+import React, { useState, useEffect, useMemo, useRef } from "react";
 import { Link } from "react-router-dom";
 import {
   Box,
@@ -22,16 +22,35 @@ import {
 } from "@mui/material";
 import SearchIcon from "@mui/icons-material/Search";
 import AddIcon from "@mui/icons-material/Add";
-import { Incident, NewIncidentPayload } from "../types/incident";
-import { getIncidents, createIncident } from "../services/api";
+import {
+  IncidentSearchHit,
+  IncidentSummary,
+  NewIncidentPayload,
+} from "../types/incident";
+import {
+  getIncidents,
+  createIncident,
+  searchIncidents,
+  subscribeToChanges,
+} from "../services/api";
+
+const SEARCH_DEBOUNCE_MS = 300;
 
 const IncidentList: React.FC = () => {
-  const [incidents, setIncidents] = useState<Incident[]>([]);
+  const [incidents, setIncidents] = useState<IncidentSummary[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
   const [openDialog, setOpenDialog] = useState<boolean>(false);
   const [searchTerm, setSearchTerm] = useState<string>("");
-  const [sortBy, setSortBy] = useState<keyof Incident>("id");
+  const [searchResults, setSearchResults] = useState<
+    IncidentSearchHit[] | null
+  >(null);
+  const [searchOffset, setSearchOffset] = useState<number | null>(null);
+  // Search hits keep their relevance order until a column sort is picked
+  const [searchSorted, setSearchSorted] = useState<boolean>(false);
+  const activeQuery = useRef<string>("");
+  const [sortBy, setSortBy] = useState<keyof IncidentSummary>("id");
   const [sortDirection, setSortDirection] = useState<"asc" | "desc">("desc");
 
   const [newIncident, setNewIncident] = useState<NewIncidentPayload>({
@@ -39,11 +58,14 @@ const IncidentList: React.FC = () => {
     actions_taken: "",
   });
 
-  const fetchIncidents = async () => {
+  const fetchIncidents = async (cursor: string | null = null) => {
     try {
       setLoading(true);
-      const data = await getIncidents();
-      setIncidents(data);
+      const page = await getIncidents(cursor);
+      setIncidents((previous) =>
+        cursor === null ? page.items : [...previous, ...page.items],
+      );
+      setNextCursor(page.next_cursor ?? null);
       setError(null);
     } catch (err) {
       setError("Failed to fetch incidents");
@@ -55,8 +77,73 @@ const IncidentList: React.FC = () => {
 
   useEffect(() => {
     fetchIncidents();
+    return subscribeToChanges((change) => {
+      const incident = change.incident;
+      if (!incident) return;
+      const summary: IncidentSummary = {
+        id: incident.id,
+        description: incident.description,
+        status: incident.status,
+      };
+      setIncidents((previous) =>
+        change.operation === "created"
+          ? [summary, ...previous.filter((item) => item.id !== summary.id)]
+          : previous.map((item) => (item.id === summary.id ? summary : item)),
+      );
+    });
   }, []);
 
+  useEffect(() => {
+    const query = searchTerm.trim();
+    activeQuery.current = query;
+    setSearchSorted(false);
+    if (!query) {
+      setSearchResults(null);
+      setSearchOffset(null);
+      return;
+    }
+
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const page = await searchIncidents(query);
+        if (!cancelled) {
+          setSearchResults(page.items);
+          setSearchOffset(page.next_offset ?? null);
+          setError(null);
+        }
+      } catch (err) {
+        if (!cancelled) {
+          setError("Failed to search incidents");
+          console.error(err);
+        }
+      }
+    }, SEARCH_DEBOUNCE_MS);
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchTerm]);
+
+  const fetchMoreSearchResults = async (offset: number) => {
+    const query = activeQuery.current;
+    try {
+      setLoading(true);
+      const page = await searchIncidents(query, offset);
+      // Drop the page if the search changed while it was loading
+      if (activeQuery.current !== query) return;
+      setSearchResults((previous) => [...(previous ?? []), ...page.items]);
+      setSearchOffset(page.next_offset ?? null);
+      setError(null);
+    } catch (err) {
+      setError("Failed to search incidents");
+      console.error(err);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const handleCreate = async () => {
     try {
       await createIncident(newIncident);
@@ -69,45 +156,46 @@ const IncidentList: React.FC = () => {
     }
   };
 
-  const handleSort = (property: keyof Incident) => {
+  const handleSort = (property: keyof IncidentSummary) => {
     const isAsc = sortBy === property && sortDirection === "asc";
     setSortDirection(isAsc ? "desc" : "asc");
     setSortBy(property);
+    if (searchResults !== null) setSearchSorted(true);
   };
 
+  const columnSorted = searchResults === null || searchSorted;
+  let loadMore: (() => Promise<void>) | null = null;
+  if (searchResults === null && nextCursor !== null) {
+    loadMore = () => fetchIncidents(nextCursor);
+  } else if (searchResults !== null && searchOffset !== null) {
+    loadMore = () => fetchMoreSearchResults(searchOffset);
+  }
+
   const filteredIncidents = useMemo(() => {
-    return incidents
-      .filter(
-        (incident) =>
-          incident.description
-            .toLowerCase()
-            .includes(searchTerm.toLowerCase()) ||
-          incident.id.toString().includes(searchTerm) ||
-          incident.status.toLowerCase().includes(searchTerm.toLowerCase()),
-      )
-      .sort((a, b) => {
-        const aValue = a[sortBy];
-        const bValue = b[sortBy];
+    if (searchResults !== null && !searchSorted) return searchResults;
+    return [...(searchResults ?? incidents)].sort((a, b) => {
+      const aValue = a[sortBy];
+      const bValue = b[sortBy];
 
-        if (typeof aValue === "string" && typeof bValue === "string") {
-          return sortDirection === "asc"
-            ? aValue.localeCompare(bValue)
-            : bValue.localeCompare(aValue);
-        }
+      if (typeof aValue === "string" && typeof bValue === "string") {
+        return sortDirection === "asc"
+          ? aValue.localeCompare(bValue)
+          : bValue.localeCompare(aValue);
+      }
 
-        if (aValue !== undefined && bValue !== undefined) {
-          return sortDirection === "asc"
-            ? aValue < bValue
-              ? -1
-              : 1
-            : bValue < aValue
-              ? -1
-              : 1;
-        }
+      if (aValue !== undefined && bValue !== undefined) {
+        return sortDirection === "asc"
+          ? aValue < bValue
+            ? -1
+            : 1
+          : bValue < aValue
+            ? -1
+            : 1;
+      }
 
-        return 0;
-      });
-  }, [incidents, searchTerm, sortBy, sortDirection]);
+      return 0;
+    });
+  }, [incidents, searchResults, searchSorted, sortBy, sortDirection]);
 
   const getStatusColor = (status: string) => {
     switch (status) {
@@ -170,7 +258,7 @@ const IncidentList: React.FC = () => {
             <TableRow>
               <TableCell>
                 <TableSortLabel
-                  active={sortBy === "id"}
+                  active={columnSorted && sortBy === "id"}
                   direction={sortBy === "id" ? sortDirection : "asc"}
                   onClick={() => handleSort("id")}
                 >
@@ -179,7 +267,7 @@ const IncidentList: React.FC = () => {
               </TableCell>
               <TableCell>
                 <TableSortLabel
-                  active={sortBy === "description"}
+                  active={columnSorted && sortBy === "description"}
                   direction={sortBy === "description" ? sortDirection : "asc"}
                   onClick={() => handleSort("description")}
                 >
@@ -188,7 +276,7 @@ const IncidentList: React.FC = () => {
               </TableCell>
               <TableCell>
                 <TableSortLabel
-                  active={sortBy === "status"}
+                  active={columnSorted && sortBy === "status"}
                   direction={sortBy === "status" ? sortDirection : "asc"}
                   onClick={() => handleSort("status")}
                 >
@@ -209,7 +297,18 @@ const IncidentList: React.FC = () => {
                       INC-{incident.id.toString().padStart(6, "0")}
                     </Link>
                   </TableCell>
-                  <TableCell>{incident.description}</TableCell>
+                  <TableCell>
+                    {incident.description}
+                    {"snippet" in incident && (
+                      <Typography
+                        variant="caption"
+                        display="block"
+                        color="text.secondary"
+                      >
+                        {incident.snippet}
+                      </Typography>
+                    )}
+                  </TableCell>
                   <TableCell>
                     <Box
                       sx={{
@@ -238,6 +337,18 @@ const IncidentList: React.FC = () => {
         </Table>
       </TableContainer>
 
+      {loadMore !== null && (
+        <Box sx={{ display: "flex", justifyContent: "center", mb: 3 }}>
+          <Button
+            variant="outlined"
+            onClick={loadMore}
+            disabled={loading}
+          >
+            {loading ? "Loading..." : "Load more"}
+          </Button>
+        </Box>
+      )}
+
       <Dialog
         open={openDialog}
         onClose={() => setOpenDialog(false)}
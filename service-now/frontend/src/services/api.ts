@@ -1,6 +1,10 @@
 import axios from "axios";
 import {
   Incident,
+  IncidentChange,
+  IncidentPage,
+  IncidentSearchPage,
+  IncidentSummary,
   NewIncidentPayload,
   UpdateIncidentPayload,
 } from "../types/incident";
@@ -14,8 +18,32 @@ const api = axios.create({
   },
 });
 
-export const getIncidents = async (): Promise<Incident[]> => {
-  const response = await api.get<Incident[]>("/incidents");
+export const PAGE_SIZE = 50;
+
+export const getIncidents = async (
+  cursor?: string | null,
+  limit: number = PAGE_SIZE,
+  orderBy: string = "-id",
+): Promise<IncidentPage<IncidentSummary>> => {
+  const response = await api.get<IncidentPage<IncidentSummary>>("/incidents", {
+    params: {
+      cursor: cursor ?? undefined,
+      limit,
+      fields: "id,description,status",
+      order_by: orderBy,
+    },
+  });
+  return response.data;
+};
+
+export const searchIncidents = async (
+  q: string,
+  offset: number = 0,
+  limit: number = PAGE_SIZE,
+): Promise<IncidentSearchPage> => {
+  const response = await api.get<IncidentSearchPage>("/incidents/search", {
+    params: { q, offset, limit },
+  });
   return response.data;
 };
 
@@ -38,3 +66,14 @@ export const updateIncident = async (
   const response = await api.put<Incident>(`/incidents/${id}`, data);
   return response.data;
 };
+
+export const subscribeToChanges = (
+  onChange: (change: IncidentChange) => void,
+): (() => void) => {
+  // EventSource reconnects on its own and resumes from the last event id
+  const source = new EventSource(`${API_URL}/incidents/changes`);
+  const handler = (event: MessageEvent) => onChange(JSON.parse(event.data));
+  source.addEventListener("created", handler);
+  source.addEventListener("updated", handler);
+  return () => source.close();
+};
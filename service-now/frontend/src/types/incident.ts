@@ -11,6 +11,33 @@ export interface Incident {
   rca?: string;
   resolution?: string;
   status: IncidentStatus;
+  created_at: string;
+  updated_at: string;
+}
+
+export type IncidentSummary = Pick<Incident, "id" | "description" | "status">;
+
+export interface IncidentPage<T> {
+  items: T[];
+  next_cursor?: string | null;
+}
+
+export interface IncidentSearchHit extends IncidentSummary {
+  snippet: string;
+  rank: number;
+}
+
+export interface IncidentSearchPage {
+  items: IncidentSearchHit[];
+  next_offset?: number | null;
+}
+
+export interface IncidentChange {
+  seq: number;
+  incident_id: number;
+  operation: "created" | "updated";
+  changed_at: string;
+  incident?: Incident | null;
 }
 
 export interface NewIncidentPayload {
@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import time
+from typing import List, Optional
+
+import httpx
+from langchain_core.runnables import RunnableLambda
+
+import rag_search
+from micro_batch import BatchedCrossEncoder, BatchedQueryEmbeddings
+from qdrant.inference import BACKENDS
+
+INCIDENTS_URL = "http://localhost:8000/incidents"
+BATCH_SIZE = 32
+CONCURRENCY = 4
+STAGES = ("fetch", "retrieve", "rerank", "generate", "write")
+
+
+class StageStats:
+    def __init__(self):
+        self.items = {stage: 0 for stage in STAGES}
+        self.seconds = {stage: 0.0 for stage in STAGES}
+
+    def record(self, stage: str, items: int, started: float):
+        self.items[stage] += items
+        self.seconds[stage] += time.perf_counter() - started
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{stage} {self.items[stage] / self.seconds[stage]:.1f}/s"
+            for stage in STAGES
+            if self.seconds[stage]
+        )
+
+
+async def fetch_pending(
+    client: httpx.AsyncClient, statuses: List[str], page_size: int, overwrite: bool
+):
+    cursor = None
+    while True:
+        params = {
+            "limit": page_size,
+            "fields": "id,description,rca",
+            "status": statuses,
+        }
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get(INCIDENTS_URL, params=params)
+        response.raise_for_status()
+        page = response.json()
+        # Incidents that already have an RCA were analyzed by an earlier run,
+        # which is what lets an interrupted backfill pick up where it stopped
+        yield [
+            incident
+            for incident in page["items"]
+            if overwrite or not incident.get("rca")
+        ]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return
+
+
+class BatchAnalyzer:
+    def __init__(
+        self,
+        concurrency: int,
+        k: int,
+        top_n: int,
+        score_gap: Optional[float],
+        backend: str,
+    ):
+        self.concurrency = concurrency
+        self.llm = rag_search.load_llm()
+        self.embeddings = BatchedQueryEmbeddings(rag_search.load_embeddings(backend))
+        self.reranker = BatchedCrossEncoder(rag_search.load_reranker(backend))
+        self.knowledge_base = rag_search.load_knowledge_base(
+            self.embeddings, self.embeddings.sparse
+        )
+        self.retriever = rag_search.build_retriever(
+            self.knowledge_base, self.reranker, k, top_n, score_gap
+        )
+        self.analysis_chain = rag_search.build_analysis_chain(self.llm)
+
+    async def analyze(self, incidents: List[dict], stats: StageStats) -> List[dict]:
+        descriptions = [incident["description"] for incident in incidents]
+        config = {"max_concurrency": self.concurrency}
+
+        started = time.perf_counter()
+        candidates = await RunnableLambda(self.retriever.search).abatch(
+            descriptions, config=config
+        )
+        stats.record("retrieve", len(incidents), started)
+
+        # Each rerank runs on its own thread and the batched cross-encoder
+        # scores the pairs of the whole batch in shared forward passes
+        started = time.perf_counter()
+        contexts = await asyncio.gather(
+            *[
+                asyncio.to_thread(self.retriever.rerank, description, documents)
+                for description, documents in zip(descriptions, candidates)
+            ]
+        )
+        stats.record("rerank", len(incidents), started)
+
+        started = time.perf_counter()
+        answers = await self.analysis_chain.abatch(
+            [
+                {"input": description, "context": context}
+                for description, context in zip(descriptions, contexts)
+            ],
+            config=config,
+            return_exceptions=True,
+        )
+        stats.record("generate", len(incidents), started)
+
+        results = []
+        for incident, answer in zip(incidents, answers):
+            if isinstance(answer, Exception):
+                print(f"Incident {incident['id']}: analysis failed: {answer}")
+                continue
+            rca, resolution = rag_search.parse_analysis(answer)
+            if rca is None or resolution is None:
+                print(f"Incident {incident['id']}: could not parse the answer")
+                continue
+            # Written back, a placeholder would read as an RCA and the
+            # incident would never be retried
+            if any(rag_search.is_undetermined(value) for value in (rca, resolution)):
+                print(f"Incident {incident['id']}: the model could not determine it")
+                continue
+            results.append({"id": incident["id"], "rca": rca, "resolution": resolution})
+        return results
+
+    def close(self):
+        self.embeddings.close()
+        self.reranker.close()
+        self.knowledge_base.client.close()
+
+
+async def write_back(client: httpx.AsyncClient, results: List[dict]) -> int:
+    response = await client.patch(INCIDENTS_URL, json={"items": results})
+    response.raise_for_status()
+    return response.json()["updated"]
+
+
+async def run(
+    statuses: List[str],
+    batch_size: int,
+    concurrency: int,
+    limit: Optional[int],
+    overwrite: bool,
+    k: int = rag_search.SEARCH_K,
+    top_n: int = rag_search.RERANK_TOP_N,
+    score_gap: Optional[float] = rag_search.SCORE_GAP,
+    backend: str = rag_search.INFERENCE_BACKEND,
+):
+    analyzer = BatchAnalyzer(concurrency, k, top_n, score_gap, backend)
+    stats = StageStats()
+    processed = updated = 0
+    started = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(timeout=60) as client:
+            pages = fetch_pending(client, statuses, batch_size, overwrite)
+            while limit is None or processed < limit:
+                fetch_started = time.perf_counter()
+                incidents = await anext(pages, None)
+                if incidents is None:
+                    break
+                if limit is not None:
+                    incidents = incidents[: limit - processed]
+                stats.record("fetch", len(incidents), fetch_started)
+                if not incidents:
+                    continue
+
+                results = await analyzer.analyze(incidents, stats)
+                if results:
+                    write_started = time.perf_counter()
+                    updated += await write_back(client, results)
+                    stats.record("write", len(results), write_started)
+                processed += len(incidents)
+
+                elapsed = time.perf_counter() - started
+                print(
+                    f"{processed} analyzed, {updated} updated, "
+                    f"{processed / elapsed:.2f} incidents/s ({stats.summary()})"
+                )
+    finally:
+        analyzer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Done: {processed} incidents analyzed, {updated} updated in {elapsed:.1f}s")
+    for stage in STAGES:
+        if stats.seconds[stage]:
+            print(
+                f"  {stage}: {stats.items[stage]} incidents in "
+                f"{stats.seconds[stage]:.1f}s, "
+                f"{stats.items[stage] / stats.seconds[stage]:.2f} incidents/s"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Suggest RCA and resolution for incidents and write them back."
+    )
+    parser.add_argument(
+        "--status",
+        action="append",
+        choices=["OPEN", "IN_PROGRESS", "CLOSED"],
+        help="Incident status to analyze, repeatable (default: OPEN)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Incidents fetched, analyzed and written back per batch",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY,
+        help="Retrievals and LLM calls in flight at once",
+    )
+    parser.add_argument("--limit", type=int, help="Stop after this many incidents")
+    parser.add_argument(
+        "--k",
+        type=int,
+        default=rag_search.SEARCH_K,
+        help="Hybrid search candidates per incident",
+    )
+    parser.add_argument(
+        "--top-n",
+        type=int,
+        default=rag_search.RERANK_TOP_N,
+        help="Incidents kept as context after reranking",
+    )
+    parser.add_argument(
+        "--score-gap",
+        type=float,
+        default=rag_search.SCORE_GAP,
+        help="Only rerank candidates within this relative gap of the top "
+        "hybrid score (default: rerank all)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=rag_search.INFERENCE_BACKEND,
+        help="Embedding and reranker inference backend (default: auto, which "
+        "uses int8 ONNX Runtime on CPU-only hosts)",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Also analyze incidents that already have an RCA",
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        run(
+            statuses=args.status or ["OPEN"],
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            limit=args.limit,
+            overwrite=args.overwrite,
+            k=args.k,
+            top_n=args.top_n,
+            score_gap=args.score_gap,
+            backend=args.backend,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
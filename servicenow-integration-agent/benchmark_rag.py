@@ -0,0 +1,323 @@
+import argparse
+import json
+import math
+import random
+import resource
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+import rag_search
+from evaluate_rerank import percentile, retrieved_incidents
+from qdrant.inference import BACKENDS
+
+INCIDENTS_URL = "http://localhost:8000/incidents"
+PAGE_SIZE = 500
+QUERIES = 200
+CUTOFFS = (1, 3, 5, 10, 20)
+STAGES = ("embed", "search", "rerank", "llm")
+
+
+def normalize_rca(rca: str) -> str:
+    return " ".join(rca.lower().split())
+
+
+def fetch_incidents(url: str = INCIDENTS_URL) -> List[dict]:
+    incidents = []
+    cursor = None
+    with httpx.Client(timeout=30) as client:
+        while True:
+            params = {"limit": PAGE_SIZE, "fields": "id,description,rca"}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get(url, params=params)
+            response.raise_for_status()
+            page = response.json()
+            incidents.extend(page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return incidents
+
+
+# Each sampled incident's description is a query, and every other incident
+# with the same RCA is relevant to it, so a hit means the retrieved context
+# carries the right root cause. Incidents whose RCA is unique have nothing to
+# find and are not sampled. Lines have the evaluate_rerank.py query-set shape.
+def build_queries(incidents: List[dict], size: int, seed: int) -> List[dict]:
+    by_rca = defaultdict(set)
+    for incident in incidents:
+        if incident.get("rca") and incident.get("description"):
+            by_rca[normalize_rca(incident["rca"])].add(str(incident["id"]))
+    labelled = [
+        incident
+        for incident in incidents
+        if incident.get("rca")
+        and incident.get("description")
+        and len(by_rca[normalize_rca(incident["rca"])]) > 1
+    ]
+    sample = random.Random(seed).sample(labelled, min(size, len(labelled)))
+    return [
+        {
+            "query": incident["description"],
+            "incident_id": str(incident["id"]),
+            "relevant": sorted(
+                by_rca[normalize_rca(incident["rca"])] - {str(incident["id"])}
+            ),
+        }
+        for incident in sample
+    ]
+
+
+# Leave-one-out: the query incident is indexed too and would almost always be
+# its own top hit, so it counts neither as relevant nor as a retrieved result
+def relevant_others(query: dict) -> set:
+    relevant = {str(incident_id) for incident_id in query["relevant"]}
+    return relevant - {str(query.get("incident_id"))}
+
+
+def ranked_others(query: dict, incident_ids: List[str]) -> List[str]:
+    return [
+        incident_id
+        for incident_id in incident_ids
+        if incident_id != str(query.get("incident_id"))
+    ]
+
+
+def load_queries(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def ranking_metrics(ranked: List[str], relevant: set, cutoffs) -> Dict[str, float]:
+    metrics = {"mrr": 0.0}
+    for rank, incident_id in enumerate(ranked, 1):
+        if incident_id in relevant:
+            metrics["mrr"] = 1 / rank
+            break
+    for cutoff in cutoffs:
+        top = ranked[:cutoff]
+        hits = [incident_id in relevant for incident_id in top]
+        metrics[f"recall@{cutoff}"] = sum(hits) / min(len(relevant), cutoff)
+        dcg = sum(1 / math.log2(rank + 1) for rank, hit in enumerate(hits, 1) if hit)
+        ideal_hits = min(len(relevant), cutoff)
+        ideal = sum(1 / math.log2(rank + 1) for rank in range(1, ideal_hits + 1))
+        metrics[f"ndcg@{cutoff}"] = dcg / ideal
+    return metrics
+
+
+def mean_metrics(rows: List[Dict[str, float]]) -> Dict[str, float]:
+    return {key: round(sum(row[key] for row in rows) / len(rows), 4) for key in rows[0]}
+
+
+def latency_summary(seconds: List[float]) -> dict:
+    if not seconds:
+        return {}
+    seconds = sorted(seconds)
+    return {
+        "count": len(seconds),
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 2),
+        "p50_ms": round(percentile(seconds, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(seconds, 0.95) * 1000, 2),
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run(
+    queries: List[dict],
+    k: int,
+    top_n: int,
+    backend: str,
+    llm_queries: int,
+) -> dict:
+    started = time.perf_counter()
+    rss_before = peak_rss_mb()
+    embeddings = rag_search.load_embeddings(backend)
+    reranker = rag_search.load_reranker(backend)
+    knowledge_base = rag_search.load_knowledge_base(embeddings, embeddings.sparse)
+    # Reranks all k candidates so both rankings are measured at every cutoff
+    retriever = rag_search.build_retriever(knowledge_base, reranker, k=k, top_n=k)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = peak_rss_mb()
+
+    # Keeps first-call allocations out of the measured latencies
+    knowledge_base.similarity_search(queries[0]["query"], k=1)
+    reranker.score([(queries[0]["query"], queries[0]["query"])])
+
+    cutoffs = [cutoff for cutoff in CUTOFFS if cutoff <= k]
+    latencies = {stage: [] for stage in STAGES}
+    hybrid, reranked = [], []
+    contexts = []
+    for query in queries:
+        relevant = relevant_others(query)
+
+        # The embeddings keep the last encoded batch, so the search below
+        # reuses these vectors and its time is the Qdrant query alone
+        started = time.perf_counter()
+        embeddings.encode([query["query"]])
+        latencies["embed"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        candidates = retriever.search(query["query"])
+        latencies["search"].append(time.perf_counter() - started)
+        hybrid.append(
+            ranking_metrics(
+                ranked_others(
+                    query,
+                    retrieved_incidents(document for document, _ in candidates),
+                ),
+                relevant,
+                cutoffs,
+            )
+        )
+
+        started = time.perf_counter()
+        documents = retriever.rerank(query["query"], candidates)
+        latencies["rerank"].append(time.perf_counter() - started)
+        reranked.append(
+            ranking_metrics(
+                ranked_others(query, retrieved_incidents(documents)), relevant, cutoffs
+            )
+        )
+        contexts.append(documents[:top_n])
+
+    analyses = parsed = 0
+    if llm_queries:
+        chain = rag_search.build_analysis_chain(rag_search.load_llm())
+        for query, context in list(zip(queries, contexts))[:llm_queries]:
+            started = time.perf_counter()
+            answer = chain.invoke({"input": query["query"], "context": context})
+            latencies["llm"].append(time.perf_counter() - started)
+            analyses += 1
+            parsed += rag_search.parse_analysis(answer) != (None, None)
+    knowledge_base.client.close()
+
+    result = {
+        "queries": len(queries),
+        "k": k,
+        "top_n": top_n,
+        "backend": backend,
+        "collection": rag_search.COLLECTION_NAME,
+        "reranker_model": rag_search.RERANKER_MODEL,
+        "metrics": {
+            "hybrid": mean_metrics(hybrid),
+            "reranked": mean_metrics(reranked),
+        },
+        "latency": {stage: latency_summary(latencies[stage]) for stage in STAGES},
+        "memory": {
+            "peak_rss_before_load_mb": rss_before,
+            "peak_rss_after_load_mb": rss_loaded,
+            "peak_rss_mb": peak_rss_mb(),
+        },
+        "model_load_seconds": round(load_seconds, 2),
+    }
+    if analyses:
+        result["llm_answers_parsed"] = round(parsed / analyses, 4)
+    return result
+
+
+def compare(result: dict, baseline: dict):
+    rows = []
+    for ranking in ("hybrid", "reranked"):
+        for key, value in result["metrics"][ranking].items():
+            previous = baseline.get("metrics", {}).get(ranking, {}).get(key)
+            if previous is not None:
+                rows.append((f"{ranking} {key}", previous, value))
+    for stage, summary in result["latency"].items():
+        previous = baseline.get("latency", {}).get(stage, {}).get("p95_ms")
+        if summary and previous is not None:
+            rows.append((f"{stage} p95_ms", previous, summary["p95_ms"]))
+    previous = baseline.get("memory", {}).get("peak_rss_mb")
+    if previous is not None:
+        rows.append(("peak_rss_mb", previous, result["memory"]["peak_rss_mb"]))
+
+    print(f"{'':<22}{'baseline':>12}{'current':>12}{'change':>12}", file=sys.stderr)
+    for name, previous, value in rows:
+        print(
+            f"{name:<22}{previous:>12}{value:>12}{value - previous:>+12.4g}",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark retrieval quality and per-stage latency of the RAG "
+        "pipeline on queries labelled from the incident data."
+    )
+    parser.add_argument(
+        "--queries",
+        type=int,
+        default=QUERIES,
+        help="Incidents sampled as queries",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Sampling seed")
+    parser.add_argument(
+        "--query-set",
+        help="Read the labelled queries from this JSONL file instead of the API",
+    )
+    parser.add_argument(
+        "--save-query-set",
+        help="Write the labelled queries to this JSONL file, usable with "
+        "evaluate_rerank.py and --query-set",
+    )
+    parser.add_argument(
+        "--k",
+        type=int,
+        default=rag_search.SEARCH_K,
+        help="Hybrid search candidates per query",
+    )
+    parser.add_argument(
+        "--top-n",
+        type=int,
+        default=rag_search.RERANK_TOP_N,
+        help="Incidents passed to the LLM as context",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=rag_search.INFERENCE_BACKEND,
+        help="Embedding and reranker inference backend",
+    )
+    parser.add_argument(
+        "--llm-queries",
+        type=int,
+        default=0,
+        help="Also time the LLM analysis on this many queries",
+    )
+    parser.add_argument("--baseline", help="Earlier results JSON to compare with")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    if args.query_set:
+        queries = load_queries(args.query_set)
+    else:
+        queries = build_queries(fetch_incidents(), args.queries, args.seed)
+    # Query sets saved before leave-one-out scoring may hold lone incidents
+    queries = [query for query in queries if relevant_others(query)]
+    if not queries:
+        sys.exit("No labelled incidents to build queries from.")
+    if args.save_query_set:
+        with open(args.save_query_set, "w") as f:
+            for query in queries:
+                f.write(json.dumps(query) + "\n")
+
+    result = run(queries, args.k, args.top_n, args.backend, args.llm_queries)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(result, json.load(f))
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
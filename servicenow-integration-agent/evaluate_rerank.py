@@ -0,0 +1,173 @@
+import argparse
+import json
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from langchain.retrievers.document_compressors.cross_encoder import BaseCrossEncoder
+
+import rag_search
+
+
+class CountingCrossEncoder(BaseCrossEncoder):
+    def __init__(self, cross_encoder: BaseCrossEncoder):
+        self.cross_encoder = cross_encoder
+        self.pairs = 0
+
+    def score(self, text_pairs: List[Tuple[str, str]]) -> List[float]:
+        self.pairs += len(text_pairs)
+        return self.cross_encoder.score(text_pairs)
+
+
+def load_queries(path: str) -> List[dict]:
+    with open(path) as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+    for query in queries:
+        query["relevant"] = {str(incident_id) for incident_id in query["relevant"]}
+    return queries
+
+
+def parse_gaps(value: str) -> List[Optional[float]]:
+    return [
+        None if gap.strip().lower() == "none" else float(gap)
+        for gap in value.split(",")
+    ]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def retrieved_incidents(documents) -> List[str]:
+    # Several chunks of one incident count once, in the rank of the first
+    return list(
+        dict.fromkeys(
+            str(document.metadata.get("incident_id")) for document in documents
+        )
+    )
+
+
+def evaluate(
+    queries: List[dict],
+    ks: List[int],
+    top_ns: List[int],
+    gaps: List[Optional[float]],
+) -> List[dict]:
+    embeddings = rag_search.load_embeddings()
+    knowledge_base = rag_search.load_knowledge_base(embeddings, embeddings.sparse)
+    reranker = CountingCrossEncoder(rag_search.load_reranker())
+    # Keeps model warm-up out of the first configuration's latency
+    knowledge_base.similarity_search(queries[0]["query"], k=1)
+    reranker.score([(queries[0]["query"], queries[0]["query"])])
+
+    results = []
+    for k in ks:
+        searches = []
+        for query in queries:
+            started = time.perf_counter()
+            candidates = knowledge_base.similarity_search_with_score(
+                query["query"], k=k
+            )
+            searches.append((candidates, time.perf_counter() - started))
+
+        for top_n in top_ns:
+            for gap in gaps:
+                retriever = rag_search.build_retriever(
+                    knowledge_base, reranker, k=k, top_n=top_n, score_gap=gap
+                )
+                latencies = []
+                recalls = []
+                hits = 0
+                skipped = 0
+                reranker.pairs = 0
+                for query, (candidates, search_seconds) in zip(queries, searches):
+                    pairs_before = reranker.pairs
+                    started = time.perf_counter()
+                    documents = retriever.rerank(query["query"], candidates)
+                    latencies.append(search_seconds + time.perf_counter() - started)
+                    if reranker.pairs == pairs_before:
+                        skipped += 1
+                    found = set(retrieved_incidents(documents)) & query["relevant"]
+                    recalls.append(len(found) / len(query["relevant"]))
+                    hits += bool(found)
+
+                latencies.sort()
+                results.append(
+                    {
+                        "k": k,
+                        "top_n": top_n,
+                        "score_gap": gap,
+                        "recall": round(sum(recalls) / len(recalls), 4),
+                        "hit_rate": round(hits / len(queries), 4),
+                        "pairs_per_query": round(reranker.pairs / len(queries), 2),
+                        "rerank_skipped": round(skipped / len(queries), 4),
+                        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+                        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                    }
+                )
+    knowledge_base.client.close()
+    return results
+
+
+def print_table(results: List[dict]):
+    columns = [
+        "k",
+        "top_n",
+        "score_gap",
+        "recall",
+        "hit_rate",
+        "pairs_per_query",
+        "rerank_skipped",
+        "mean_ms",
+        "p95_ms",
+    ]
+    print("  ".join(f"{column:>15}" for column in columns), file=sys.stderr)
+    for result in results:
+        print(
+            "  ".join(f"{str(result[column]):>15}" for column in columns),
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the recall and cost of retrieval depth and adaptive "
+        "reranking settings over a labelled query set."
+    )
+    parser.add_argument(
+        "queries",
+        help='JSONL file of {"query": "...", "relevant": [incident ids]} lines',
+    )
+    parser.add_argument(
+        "--k", default="5,10,20", help="Comma separated hybrid search depths"
+    )
+    parser.add_argument(
+        "--top-n", default="4", help="Comma separated numbers of incidents kept"
+    )
+    parser.add_argument(
+        "--score-gaps",
+        default="none,0.05,0.1,0.2,0.3",
+        help="Comma separated adaptive score gaps, 'none' always reranks",
+    )
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = evaluate(
+        load_queries(args.queries),
+        [int(k) for k in args.k.split(",")],
+        [int(top_n) for top_n in args.top_n.split(",")],
+        parse_gaps(args.score_gaps),
+    )
+    print_table(results)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
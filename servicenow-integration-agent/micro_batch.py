@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from langchain.retrievers.document_compressors.cross_encoder import BaseCrossEncoder
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant import SparseEmbeddings, SparseVector
+
+from qdrant.bge_sparse_embeddings import BGEM3Embeddings
+from query_cache import QueryCache
+
+MAX_BATCH_SIZE = 32
+MAX_WAIT_SECONDS = 0.005
+RECENT_QUERIES = 256
+
+
+# Collects items submitted from many threads into batches for a single model
+# call. The first item of a batch waits at most `max_wait` seconds for others
+# to join, and model calls run one at a time on the batcher's own thread, so
+# concurrent requests share forward passes instead of contending for the
+# device.
+class MicroBatcher:
+    def __init__(
+        self,
+        fn: Callable[[List], Sequence],
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_WAIT_SECONDS,
+    ):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future))
+        return future.result()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            closing = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+
+            try:
+                results = self.fn([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            if closing:
+                return
+
+
+# Query embeddings for the retriever, batched across concurrent requests.
+# Hybrid search asks for the dense and then the sparse vector of the same
+# query, so encoded queries are cached for the second lookup, and for repeat
+# queries when a shared QueryCache is passed in.
+class BatchedQueryEmbeddings(Embeddings):
+    def __init__(
+        self,
+        embeddings: BGEM3Embeddings,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_WAIT_SECONDS,
+        cache: Optional[QueryCache] = None,
+    ):
+        self.embeddings = embeddings
+        self.batcher = MicroBatcher(self._encode, max_batch_size, max_wait)
+        self.sparse = BatchedSparseView(self)
+        self.cache = cache or QueryCache(RECENT_QUERIES)
+
+    def _encode(self, texts: List[str]) -> List[Tuple[List[float], SparseVector]]:
+        unique = list(dict.fromkeys(texts))
+        dense, sparse = self.embeddings.encode(unique)
+        vectors = dict(zip(unique, zip(dense, sparse)))
+        return [vectors[text] for text in texts]
+
+    def encode_query(self, text: str) -> Tuple[List[float], SparseVector]:
+        vectors = self.cache.get_vectors(text)
+        if vectors is None:
+            vectors = self.batcher.submit(text)
+            self.cache.put_vectors(text, vectors)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode_query(text)[0]
+
+    def close(self):
+        self.batcher.close()
+
+
+class BatchedSparseView(SparseEmbeddings):
+    def __init__(self, embeddings: BatchedQueryEmbeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[SparseVector]:
+        return self.embeddings.embeddings.sparse.embed_documents(texts)
+
+    def embed_query(self, text: str) -> SparseVector:
+        return self.embeddings.encode_query(text)[1]
+
+
+# Scores the rerank pairs of concurrent requests in one cross-encoder call
+class BatchedCrossEncoder(BaseCrossEncoder):
+    def __init__(
+        self,
+        cross_encoder: BaseCrossEncoder,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_WAIT_SECONDS,
+    ):
+        self.cross_encoder = cross_encoder
+        self.batcher = MicroBatcher(self._score, max_batch_size, max_wait)
+
+    def _score(self, groups: List[List[Tuple[str, str]]]) -> List[List[float]]:
+        pairs = [pair for group in groups for pair in group]
+        scores = list(self.cross_encoder.score(pairs)) if pairs else []
+        results = []
+        offset = 0
+        for group in groups:
+            results.append(scores[offset : offset + len(group)])
+            offset += len(group)
+        return results
+
+    def score(self, text_pairs: List[Tuple[str, str]]) -> List[float]:
+        return self.batcher.submit(list(text_pairs))
+
+    def close(self):
+        self.batcher.close()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+import rag_search
+from qdrant.inference import MAX_LENGTH, load_bge_m3, load_cross_encoder
+
+QUERIES = [
+    "The website is down and customers are unable to place orders.",
+    "Price mismatch between the product page and the checkout page",
+    "Payment gateway timeouts during checkout for card payments",
+    "Order confirmation emails are not being delivered to customers",
+]
+DOCUMENTS = [
+    "Checkout service returned HTTP 503 after the load balancer health checks "
+    "failed. Restarting the checkout pods restored order placement.",
+    "Product catalog cache served stale prices after a pricing update. "
+    "Flushing the cache fixed the mismatch between product page and cart.",
+    "The payment provider rate limited our API key, causing card payments to "
+    "time out. The limit was raised and retries were added.",
+    "SMTP relay credentials expired, so transactional emails queued up. "
+    "Rotating the credentials flushed the queue.",
+    "Search results were empty because the indexing job failed overnight. "
+    "Re-running the job restored search.",
+    "Mobile app crashed on launch after a release with a bad feature flag. "
+    "The flag was rolled back.",
+]
+# Well past BGEM3FlagModel's default 512 token limit, with the distinguishing
+# details at the end, so a backend that truncates long chunks fails parity
+LONG_DOCUMENT = (
+    " ".join(DOCUMENTS * 6)
+    + " Root cause: an expired TLS certificate on the internal order API. "
+    "Renewing the certificate and adding expiry alerts resolved the incident."
+)
+MIN_DENSE_COSINE = 0.98
+MIN_SPARSE_COSINE = 0.95
+MIN_RANK_CORRELATION = 0.9
+
+
+def cosine(a, b) -> float:
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def sparse_cosine(a: Dict, b: Dict) -> float:
+    a = {str(token): float(weight) for token, weight in a.items()}
+    b = {str(token): float(weight) for token, weight in b.items()}
+    dot = sum(weight * b.get(token, 0.0) for token, weight in a.items())
+    norm = np.sqrt(sum(w * w for w in a.values()) * sum(w * w for w in b.values()))
+    return float(dot / norm) if norm else float(a == b)
+
+
+def rank_correlation(a: List[float], b: List[float]) -> float:
+    # Spearman correlation of two score lists over the same documents
+    if len(a) < 2:
+        return 1.0
+    rank_a = np.argsort(np.argsort(a))
+    rank_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+def throughput(fn, items: int, repeats: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return items * repeats / (time.perf_counter() - started)
+
+
+def compare_embeddings(repeats: int) -> dict:
+    texts = QUERIES + DOCUMENTS + [LONG_DOCUMENT]
+    models = {
+        backend: load_bge_m3(backend=backend, device="cpu")
+        for backend in ("torch", "onnx")
+    }
+    outputs = {
+        backend: model.encode(
+            texts, max_length=MAX_LENGTH, return_dense=True, return_sparse=True
+        )
+        for backend, model in models.items()
+    }
+    expected, actual = outputs["torch"], outputs["onnx"]
+
+    # Both backends have to order the documents the same way for each query
+    correlations = []
+    for backend_output in (expected, actual):
+        dense = np.asarray(backend_output["dense_vecs"])
+        backend_output["similarity"] = dense[: len(QUERIES)] @ dense[len(QUERIES) :].T
+    for expected_row, actual_row in zip(expected["similarity"], actual["similarity"]):
+        correlations.append(rank_correlation(expected_row, actual_row))
+
+    def encode(model):
+        return lambda: model.encode(
+            texts, max_length=MAX_LENGTH, return_dense=True, return_sparse=True
+        )
+
+    return {
+        "min_dense_cosine": min(
+            cosine(a, b) for a, b in zip(expected["dense_vecs"], actual["dense_vecs"])
+        ),
+        "min_sparse_cosine": min(
+            sparse_cosine(a, b)
+            for a, b in zip(expected["lexical_weights"], actual["lexical_weights"])
+        ),
+        "min_rank_correlation": min(correlations),
+        "torch_texts_per_s": throughput(encode(models["torch"]), len(texts), repeats),
+        "onnx_texts_per_s": throughput(encode(models["onnx"]), len(texts), repeats),
+    }
+
+
+def compare_reranker(repeats: int) -> dict:
+    pairs = [(query, document) for query in QUERIES for document in DOCUMENTS]
+    cross_encoders = {
+        backend: load_cross_encoder(rag_search.RERANKER_MODEL, backend, "cpu")
+        for backend in ("torch", "onnx")
+    }
+    expected = list(cross_encoders["torch"].score(pairs))
+    actual = list(cross_encoders["onnx"].score(pairs))
+
+    correlations = []
+    same_top = 0
+    for offset in range(0, len(pairs), len(DOCUMENTS)):
+        expected_row = expected[offset : offset + len(DOCUMENTS)]
+        actual_row = actual[offset : offset + len(DOCUMENTS)]
+        correlations.append(rank_correlation(expected_row, actual_row))
+        same_top += int(np.argmax(expected_row) == np.argmax(actual_row))
+
+    def score(cross_encoder):
+        return lambda: cross_encoder.score(pairs)
+
+    return {
+        "max_score_difference": max(abs(a - b) for a, b in zip(expected, actual)),
+        "min_rank_correlation": min(correlations),
+        "same_top_document": same_top / len(QUERIES),
+        "torch_pairs_per_s": throughput(
+            score(cross_encoders["torch"]), len(pairs), repeats
+        ),
+        "onnx_pairs_per_s": throughput(
+            score(cross_encoders["onnx"]), len(pairs), repeats
+        ),
+    }
+
+
+def failures(embeddings: dict, reranker: dict) -> List[str]:
+    checks = [
+        ("embedding dense cosine", embeddings["min_dense_cosine"], MIN_DENSE_COSINE),
+        (
+            "embedding sparse cosine",
+            embeddings["min_sparse_cosine"],
+            MIN_SPARSE_COSINE,
+        ),
+        (
+            "embedding rank correlation",
+            embeddings["min_rank_correlation"],
+            MIN_RANK_CORRELATION,
+        ),
+        (
+            "reranker rank correlation",
+            reranker["min_rank_correlation"],
+            MIN_RANK_CORRELATION,
+        ),
+        ("reranker top document", reranker["same_top_document"], 1.0),
+    ]
+    return [
+        f"{name} {value:.4f} is below {minimum}"
+        for name, value, minimum in checks
+        if value < minimum
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that the int8 ONNX models match the PyTorch models on "
+        "CPU and compare their throughput."
+    )
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per backend")
+    args = parser.parse_args()
+
+    embeddings = compare_embeddings(args.repeats)
+    reranker = compare_reranker(args.repeats)
+    print(
+        json.dumps(
+            {
+                "embeddings": {k: round(v, 4) for k, v in embeddings.items()},
+                "reranker": {k: round(v, 4) for k, v in reranker.items()},
+            },
+            indent=2,
+        )
+    )
+    embedding_speedup = embeddings["onnx_texts_per_s"] / embeddings["torch_texts_per_s"]
+    reranker_speedup = reranker["onnx_pairs_per_s"] / reranker["torch_pairs_per_s"]
+    print(
+        f"Embedding speed-up {embedding_speedup:.1f}x, "
+        f"reranker speed-up {reranker_speedup:.1f}x",
+        file=sys.stderr,
+    )
+    failed = failures(embeddings, reranker)
+    for failure in failed:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,20 @@
-from typing import List
+from typing import List, Tuple
 
 from FlagEmbedding import BGEM3FlagModel
+from langchain_core.embeddings import Embeddings
 from langchain_qdrant import SparseEmbeddings, SparseVector
 
+# BGE-M3's full context, the same as inference.MAX_LENGTH. BGEM3FlagModel
+# truncates to 512 tokens unless told otherwise, which cuts most chunks short.
+MAX_LENGTH = 8192
+
+
+def to_sparse_vector(lexical_weights) -> SparseVector:
+    return SparseVector(
+        indices=[int(token_id) for token_id in lexical_weights.keys()],
+        values=[float(weight) for weight in lexical_weights.values()],
+    )
+
 
 class BGEM3SparseEmbeddings(SparseEmbeddings):
 
@@ -11,7 +23,11 @@ class BGEM3SparseEmbeddings(SparseEmbeddings):
 
     def embed_documents(self, texts: List[str]) -> List[SparseVector]:
         embeddings = self.model.encode(
-            texts, return_dense=False, return_sparse=True, return_colbert_vecs=False
+            texts,
+            max_length=MAX_LENGTH,
+            return_dense=False,
+            return_sparse=True,
+            return_colbert_vecs=False,
         )
 
         sparse_embeddings = embeddings["lexical_weights"]
@@ -23,3 +39,53 @@ class BGEM3SparseEmbeddings(SparseEmbeddings):
 
     def embed_query(self, text: str) -> SparseVector:
         return self.embed_documents([text])[0]
+
+
+# Dense and sparse BGE-M3 vectors from a single forward pass. In hybrid mode
+# QdrantVectorStore asks the dense and then the sparse embeddings for the same
+# texts, so the last batch is kept and the second call is answered without
+# running the model again. Use the instance as the dense embedding and its
+# `sparse` attribute as the sparse embedding. `model` takes any object with
+# BGEM3FlagModel's `encode`, such as the ONNX backend's ONNXBGEM3Model.
+class BGEM3Embeddings(Embeddings):
+    def __init__(self, model_name: str = "BAAI/bge-m3", model=None, **kwargs):
+        self.model = model or BGEM3FlagModel(model_name, **kwargs)
+        self.sparse = BGEM3SparseView(self)
+        self._last_batch = None
+
+    def encode(self, texts: List[str]) -> Tuple[List[List[float]], List[SparseVector]]:
+        # Read and replace the batch as one tuple so concurrent callers never
+        # pair one batch's texts with another batch's vectors.
+        last_batch = self._last_batch
+        if last_batch is not None and last_batch[0] == texts:
+            return last_batch[1], last_batch[2]
+
+        output = self.model.encode(
+            texts,
+            max_length=MAX_LENGTH,
+            return_dense=True,
+            return_sparse=True,
+            return_colbert_vecs=False,
+        )
+        dense = [vector.tolist() for vector in output["dense_vecs"]]
+        sparse = [to_sparse_vector(weights) for weights in output["lexical_weights"]]
+        self._last_batch = (list(texts), dense, sparse)
+        return dense, sparse
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts)[0]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0][0]
+
+
+class BGEM3SparseView(SparseEmbeddings):
+
+    def __init__(self, embeddings: BGEM3Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[SparseVector]:
+        return self.embeddings.encode(texts)[1]
+
+    def embed_query(self, text: str) -> SparseVector:
+        return self.embeddings.encode([text])[1][0]
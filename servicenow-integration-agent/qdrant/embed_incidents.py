@@ -1,65 +1,562 @@
+import argparse
+import hashlib
+import json
+import queue
+import sqlite3
+import threading
+import time
 import uuid
+from typing import Dict, List
 
 import requests
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 from langchain_qdrant import RetrievalMode, QdrantVectorStore
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from qdrant_client import models
 
-from bge_sparse_embeddings import BGEM3SparseEmbeddings
+from bge_sparse_embeddings import BGEM3Embeddings
+from inference import BACKENDS, load_bge_m3
+from storage import client_options, create_client
 
+INCIDENTS_URL = "http://localhost:8000/incidents"
+RAG_SERVICE_URL = "http://localhost:8001"
+COLLECTION_NAME = "incidents"
+MANIFEST_FILE = "incident_manifest.db"
+PAGE_SIZE = 500
+BATCH_SIZE = 32
+EMBED_WORKERS = 2
+QUEUE_SIZE = 8
+PROGRESS_SECONDS = 10
 
-def main():
-    response = requests.get("http://localhost:8000/incidents")
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch incidents: {response.status_code}")
-    incidents = response.json()
-
-    print(f"Processing {len(incidents)} incidents...")
-
-    documents = []
-    for incident in incidents:
-        content = f"Incident Description: {incident.get('description', '')}\n\n"
-        content += f"Actions Taken: {incident.get('actions_taken', '')}\n\n"
-        content += f"Root Cause Analysis: {incident.get('rca', '')}\n\n"
-        content += f"Resolution: {incident.get('resolution', '')}"
-
-        doc = Document(
-            page_content=content,
-            metadata={
-                "incident_id": incident.get("id", str(uuid.uuid4())),
-            },
+# Point ids are derived from the incident id and chunk position, so re-embedding
+# an incident overwrites its previous points instead of adding new ones.
+POINT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "telco-incident-analysis/incidents")
+
+
+def incident_content(incident) -> str:
+    content = f"Incident Description: {incident.get('description', '')}\n\n"
+    content += f"Actions Taken: {incident.get('actions_taken', '')}\n\n"
+    content += f"Root Cause Analysis: {incident.get('rca', '')}\n\n"
+    content += f"Resolution: {incident.get('resolution', '')}"
+    return content
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def point_id(incident_id, chunk_index: int) -> str:
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{incident_id}:{chunk_index}"))
+
+
+class Manifest:
+    def __init__(self, path: str = MANIFEST_FILE):
+        # Written by the upsert stage, loaded and pruned by the main thread
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+        CREATE TABLE IF NOT EXISTS MANIFEST (
+            incident_id TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            point_ids TEXT NOT NULL
         )
-        documents.append(doc)
+        """
+        )
+        self.conn.commit()
 
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        encoding_name="cl100k_base",
-        chunk_size=1536,
-        chunk_overlap=256,
-        add_start_index=True,
-    )
+    def load(self) -> Dict[str, dict]:
+        rows = self.conn.execute(
+            "SELECT incident_id, content_hash, point_ids FROM MANIFEST"
+        )
+        return {
+            incident_id: {"hash": digest, "point_ids": json.loads(point_ids)}
+            for incident_id, digest, point_ids in rows
+        }
 
-    chunks = text_splitter.split_documents(documents)
-    print(f"Created {len(chunks)} chunks from {len(documents)} incidents")
+    def upsert(self, entries: Dict[str, dict]):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO MANIFEST (incident_id, content_hash, point_ids) "
+            "VALUES (?, ?, ?)",
+            [
+                (incident_id, entry["hash"], json.dumps(entry["point_ids"]))
+                for incident_id, entry in entries.items()
+            ],
+        )
+        self.conn.commit()
+
+    def remove(self, incident_ids: List[str]):
+        self.conn.executemany(
+            "DELETE FROM MANIFEST WHERE incident_id = ?",
+            [(incident_id,) for incident_id in incident_ids],
+        )
+        self.conn.commit()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM MANIFEST")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
 
-    embeddings = HuggingFaceEmbeddings(
-        model_name="BAAI/bge-m3", model_kwargs={"device": "mps"}
-    )
 
-    sparse_embeddings = BGEM3SparseEmbeddings()
+def fetch_pages(session: requests.Session, page_size: int):
+    cursor = None
+    while True:
+        params = {"limit": page_size}
+        if cursor:
+            params["cursor"] = cursor
+        response = session.get(INCIDENTS_URL, params=params)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch incidents: {response.status_code}")
+        page = response.json()
+        yield page["items"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return
 
-    QdrantVectorStore.from_documents(
-        documents=chunks,
+
+def build_vector_store(full: bool, backend: str) -> QdrantVectorStore:
+    embeddings = BGEM3Embeddings(model=load_bge_m3(backend=backend))
+
+    return QdrantVectorStore.construct_instance(
         embedding=embeddings,
-        sparse_embedding=sparse_embeddings,
-        url=f"http://localhost:6333",
-        prefer_grpc=True,
-        collection_name="incidents",
-        force_recreate=True,
+        sparse_embedding=embeddings.sparse,
+        client_options=client_options(),
+        collection_name=COLLECTION_NAME,
+        force_recreate=full,
         retrieval_mode=RetrievalMode.HYBRID,
     )
 
-    print("Embedding completed and stored in Qdrant.")
+
+def invalidate_rag_cache():
+    try:
+        requests.post(f"{RAG_SERVICE_URL}/cache/invalidate", timeout=5)
+    except requests.RequestException:
+        # The service may not be running, cached results also expire on a TTL
+        pass
+
+
+def collection_exists() -> bool:
+    client = create_client()
+    try:
+        return client.collection_exists(COLLECTION_NAME)
+    finally:
+        client.close()
+
+
+class StageStats:
+    def __init__(self, name: str, unit: str = "chunks"):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, items: int, started: float):
+        with self.lock:
+            self.items += items
+            self.seconds += time.perf_counter() - started
+
+    def summary(self, elapsed: float) -> str:
+        # Busy time excludes waiting on the neighbouring queues and is summed
+        # over workers, so the busy rate is what a single worker sustains.
+        rate = self.items / elapsed if elapsed else 0.0
+        busy_rate = self.items / self.seconds if self.seconds else 0.0
+        return (
+            f"{self.name}: {self.items} {self.unit}, {rate:.1f} {self.unit}/s "
+            f"({busy_rate:.1f} {self.unit}/s busy)"
+        )
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+# Stages run in threads connected by bounded queues, so a slow stage blocks
+# the ones feeding it instead of letting the corpus pile up in memory. When a
+# stage fails every other stage gives up at its next queue operation.
+class Pipeline:
+    def __init__(self):
+        self.failed = threading.Event()
+        self.error = None
+        self.threads = []
+
+    def put(self, q: queue.Queue, item):
+        while not self.failed.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+        raise PipelineAborted()
+
+    def get(self, q: queue.Queue):
+        while not self.failed.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                pass
+        raise PipelineAborted()
+
+    def start(self, target, *args) -> threading.Thread:
+        def run():
+            try:
+                target(*args)
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                self.error = e
+                self.failed.set()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        return thread
+
+    def abort(self):
+        self.failed.set()
+
+    def join(self, threads: List[threading.Thread], progress):
+        last_report = time.perf_counter()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+                if time.perf_counter() - last_report >= PROGRESS_SECONDS:
+                    progress()
+                    last_report = time.perf_counter()
+        if self.error is not None:
+            raise self.error
+
+
+class EmbeddingPipeline:
+    def __init__(
+        self,
+        manifest: Manifest,
+        known: Dict[str, dict],
+        page_size: int,
+        batch_size: int,
+        workers: int,
+        queue_size: int,
+        backend: str,
+    ):
+        self.manifest = manifest
+        self.known = known
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.workers = workers
+        self.backend = backend
+        self.pipeline = Pipeline()
+        self.documents = queue.Queue(maxsize=queue_size)
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.vectors = queue.Queue(maxsize=queue_size)
+        self.hashes = {}
+        # Incidents whose chunks are not all upserted yet. An incident is only
+        # written to the manifest once all of its points are in Qdrant, which
+        # makes the manifest the checkpoint an interrupted run resumes from.
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.stale_points = 0
+        self.fetch_stats = StageStats("fetch", "incidents")
+        self.chunk_stats = StageStats("chunk")
+        self.embed_stats = StageStats("embed")
+        self.upsert_stats = StageStats("upsert")
+        self.started = time.perf_counter()
+
+    def fetch(self):
+        session = requests.Session()
+        pages = fetch_pages(session, self.page_size)
+        while True:
+            started = time.perf_counter()
+            incidents = next(pages, None)
+            if incidents is None:
+                break
+            documents = []
+            for incident in incidents:
+                incident_id = str(incident.get("id", uuid.uuid4()))
+                content = incident_content(incident)
+                digest = content_hash(content)
+                self.hashes[incident_id] = digest
+                entry = self.known.get(incident_id)
+                if entry is not None and entry["hash"] == digest:
+                    continue
+                documents.append(
+                    Document(
+                        page_content=content,
+                        metadata={
+                            "incident_id": incident.get("id", incident_id),
+                            "content_hash": digest,
+                        },
+                    )
+                )
+            self.fetch_stats.record(len(incidents), started)
+            if documents:
+                self.pipeline.put(self.documents, documents)
+        self.pipeline.put(self.documents, None)
+
+    def chunk(self, documents: List[Document]):
+        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name="cl100k_base",
+            chunk_size=1536,
+            chunk_overlap=256,
+            add_start_index=True,
+        )
+        batch = []
+        while documents is not None:
+            started = time.perf_counter()
+            chunks = text_splitter.split_documents(documents)
+            point_ids = {}
+            items = []
+            for chunk in chunks:
+                incident_id = str(chunk.metadata["incident_id"])
+                ids = point_ids.setdefault(incident_id, [])
+                ids.append(point_id(incident_id, len(ids)))
+                items.append((incident_id, ids[-1], chunk))
+            with self.pending_lock:
+                for incident_id, ids in point_ids.items():
+                    self.pending[incident_id] = {
+                        "point_ids": ids,
+                        "remaining": len(ids),
+                    }
+            self.chunk_stats.record(len(chunks), started)
+
+            for item in items:
+                batch.append(item)
+                if len(batch) == self.batch_size:
+                    self.pipeline.put(self.batches, batch)
+                    batch = []
+            documents = self.pipeline.get(self.documents)
+
+        if batch:
+            self.pipeline.put(self.batches, batch)
+        for _ in range(self.workers):
+            self.pipeline.put(self.batches, None)
+
+    def embed(self, embeddings):
+        while True:
+            batch = self.pipeline.get(self.batches)
+            if batch is None:
+                return
+            started = time.perf_counter()
+            dense, sparse = embeddings.encode(
+                [chunk.page_content for _, _, chunk in batch]
+            )
+            self.embed_stats.record(len(batch), started)
+            self.pipeline.put(self.vectors, (batch, dense, sparse))
+
+    def upsert(self, vector_store: QdrantVectorStore):
+        client = vector_store.client
+        while True:
+            item = self.pipeline.get(self.vectors)
+            if item is None:
+                return
+            started = time.perf_counter()
+            batch, dense, sparse = item
+            points = [
+                models.PointStruct(
+                    id=chunk_id,
+                    vector={
+                        vector_store.vector_name: dense_vector,
+                        vector_store.sparse_vector_name: models.SparseVector(
+                            indices=sparse_vector.indices,
+                            values=sparse_vector.values,
+                        ),
+                    },
+                    payload={
+                        vector_store.content_payload_key: chunk.page_content,
+                        vector_store.metadata_payload_key: chunk.metadata,
+                    },
+                )
+                for (_, chunk_id, chunk), dense_vector, sparse_vector in zip(
+                    batch, dense, sparse
+                )
+            ]
+            client.upsert(COLLECTION_NAME, points=points, wait=True)
+
+            completed = {}
+            with self.pending_lock:
+                for incident_id, _, _ in batch:
+                    entry = self.pending[incident_id]
+                    entry["remaining"] -= 1
+                    if entry["remaining"] == 0:
+                        completed[incident_id] = self.pending.pop(incident_id)
+
+            # Changed incidents that now have fewer chunks leave trailing points
+            stale = [
+                stale_id
+                for incident_id, entry in completed.items()
+                for stale_id in self.known.get(incident_id, {}).get("point_ids", [])
+                if stale_id not in entry["point_ids"]
+            ]
+            if stale:
+                client.delete(
+                    COLLECTION_NAME,
+                    points_selector=models.PointIdsList(points=stale),
+                    wait=True,
+                )
+                self.stale_points += len(stale)
+            if completed:
+                self.manifest.upsert(
+                    {
+                        incident_id: {
+                            "hash": self.hashes[incident_id],
+                            "point_ids": entry["point_ids"],
+                        }
+                        for incident_id, entry in completed.items()
+                    }
+                )
+            self.upsert_stats.record(len(batch), started)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        for stats in (
+            self.fetch_stats,
+            self.chunk_stats,
+            self.embed_stats,
+            self.upsert_stats,
+        ):
+            print(f"  {stats.summary(elapsed)}")
+
+    def run(self, full: bool) -> bool:
+        pipeline = self.pipeline
+        fetcher = pipeline.start(self.fetch)
+        # The models are only loaded once there is something to embed
+        try:
+            first = pipeline.get(self.documents)
+        except PipelineAborted:
+            pipeline.join([fetcher], self.report)
+            raise
+        if first is None:
+            return False
+
+        vector_store = build_vector_store(full, self.backend)
+        chunker = pipeline.start(self.chunk, first)
+        embedders = [
+            pipeline.start(self.embed, vector_store.embeddings)
+            for _ in range(self.workers)
+        ]
+        upserter = pipeline.start(self.upsert, vector_store)
+        try:
+            pipeline.join([fetcher, chunker, *embedders], self.report)
+            pipeline.put(self.vectors, None)
+            pipeline.join([upserter], self.report)
+        except PipelineAborted:
+            pipeline.join(pipeline.threads, self.report)
+        except KeyboardInterrupt:
+            pipeline.abort()
+            for thread in pipeline.threads:
+                thread.join()
+            print("Interrupted, completed incidents are kept in the manifest.")
+            raise
+        finally:
+            vector_store.client.close()
+        return True
+
+
+def sync(
+    full: bool = False,
+    page_size: int = PAGE_SIZE,
+    batch_size: int = BATCH_SIZE,
+    workers: int = EMBED_WORKERS,
+    queue_size: int = QUEUE_SIZE,
+    backend: str = "auto",
+):
+    manifest = Manifest()
+    if full or not collection_exists():
+        # Points recorded in the manifest are gone with the collection
+        manifest.clear()
+    known = manifest.load()
+
+    embedding = EmbeddingPipeline(
+        manifest, known, page_size, batch_size, workers, queue_size, backend
+    )
+    try:
+        embedded = embedding.run(full)
+    finally:
+        manifest.close()
+    if embedded:
+        embedding.report()
+
+    removed = [
+        incident_id for incident_id in known if incident_id not in embedding.hashes
+    ]
+    if removed:
+        manifest = Manifest()
+        client = create_client()
+        try:
+            client.delete(
+                COLLECTION_NAME,
+                points_selector=models.PointIdsList(
+                    points=[
+                        stale_id
+                        for incident_id in removed
+                        for stale_id in known[incident_id]["point_ids"]
+                    ]
+                ),
+                wait=True,
+            )
+            manifest.remove(removed)
+        finally:
+            client.close()
+            manifest.close()
+
+    print(
+        f"{len(embedding.hashes)} incidents, {embedding.upsert_stats.items} points "
+        f"upserted, {embedding.stale_points} stale points deleted, "
+        f"{len(removed)} removed incidents"
+    )
+    if embedded or removed:
+        invalidate_rag_cache()
+    else:
+        print("Qdrant collection is up to date.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed incidents into Qdrant.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Recreate the collection and re-embed every incident",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=PAGE_SIZE,
+        help="Incidents fetched per API request",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Chunks embedded and upserted per batch",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=EMBED_WORKERS,
+        help="Embedding worker threads",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=QUEUE_SIZE,
+        help="Items buffered between pipeline stages",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="auto",
+        help="BGE-M3 inference backend (default: auto, which uses int8 ONNX "
+        "Runtime on CPU-only hosts)",
+    )
+    args = parser.parse_args()
+    sync(
+        full=args.full,
+        page_size=args.page_size,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        backend=args.backend,
+    )
 
 
 if __name__ == "__main__":
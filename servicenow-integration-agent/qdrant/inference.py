@@ -0,0 +1,347 @@
+import importlib.util
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.retrievers.document_compressors.cross_encoder import BaseCrossEncoder
+
+BGE_M3_MODEL = "BAAI/bge-m3"
+BACKENDS = ("auto", "torch", "onnx")
+ONNX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "telco-incident-onnx")
+ONNX_OPSET = 17
+BATCH_SIZE = 32
+MAX_LENGTH = 8192
+
+
+def detect_device() -> str:
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+# "auto" runs PyTorch on an accelerator and the quantized ONNX models on CPU,
+# falling back to PyTorch when onnxruntime is not installed.
+def resolve_backend(backend: str, device: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown inference backend {backend!r}, use one of {BACKENDS}"
+        )
+    if backend != "auto":
+        return backend
+    if device == "cpu" and importlib.util.find_spec("onnxruntime") is not None:
+        return "onnx"
+    return "torch"
+
+
+def model_path(model_name: str) -> str:
+    if os.path.isdir(model_name):
+        return model_name
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(model_name)
+
+
+def export_path(model_name: str, quantize: bool, onnx_dir: str = ONNX_DIR) -> str:
+    name = model_name.strip("/").replace("/", "--")
+    filename = "model.int8.onnx" if quantize else "model.onnx"
+    return os.path.join(onnx_dir, name, filename)
+
+
+# Exports a PyTorch module to ONNX once and reuses the file afterwards. The
+# full-precision models are larger than the 2GB protobuf limit, so their weights
+# go to external data files next to the graph. Dynamic int8 quantization then
+# stores the weights as int8 and quantizes activations on the fly, which needs
+# no calibration data.
+def export_onnx(
+    module,
+    input_names: List[str],
+    output_names: List[str],
+    dynamic_axes: Dict[str, Dict[int, str]],
+    path: str,
+    quantize: bool,
+) -> str:
+    import torch
+
+    fp32_path = os.path.join(os.path.dirname(path), "model.onnx")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(fp32_path):
+        dummy = torch.ones((1, 8), dtype=torch.long)
+        with torch.no_grad():
+            torch.onnx.export(
+                module.eval(),
+                tuple(dummy for _ in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=output_names,
+                dynamic_axes=dynamic_axes,
+                opset_version=ONNX_OPSET,
+            )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+    return path
+
+
+def load_session(path: str, threads: Optional[int] = None):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return onnxruntime.InferenceSession(
+        path, options, providers=["CPUExecutionProvider"]
+    )
+
+
+def length_sorted_batches(lengths: List[int], batch_size: int) -> List[List[int]]:
+    # Texts of similar length share a batch so little compute goes to padding
+    order = sorted(range(len(lengths)), key=lambda index: -lengths[index])
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def bge_m3_module(path: str):
+    import torch
+    from transformers import AutoModel
+
+    class BGEM3Heads(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = AutoModel.from_pretrained(path)
+            self.sparse_linear = torch.nn.Linear(self.encoder.config.hidden_size, 1)
+            self.sparse_linear.load_state_dict(
+                torch.load(os.path.join(path, "sparse_linear.pt"), map_location="cpu")
+            )
+
+        def forward(self, input_ids, attention_mask):
+            hidden = self.encoder(
+                input_ids=input_ids, attention_mask=attention_mask
+            ).last_hidden_state
+            dense = torch.nn.functional.normalize(hidden[:, 0], dim=-1)
+            sparse = torch.relu(self.sparse_linear(hidden)).squeeze(-1)
+            return dense, sparse
+
+    return BGEM3Heads()
+
+
+# BGE-M3 on ONNX Runtime with the same `encode` interface and output as
+# FlagEmbedding's BGEM3FlagModel. The exported graph contains the dense (CLS,
+# normalized) and sparse (ReLU over a linear head, per token) heads, so one
+# session run yields both vectors. ColBERT vectors are not exported.
+class ONNXBGEM3Model:
+    def __init__(
+        self,
+        model_name: str = BGE_M3_MODEL,
+        quantize: bool = True,
+        onnx_dir: str = ONNX_DIR,
+        batch_size: int = BATCH_SIZE,
+        max_length: int = MAX_LENGTH,
+        threads: Optional[int] = None,
+    ):
+        from transformers import AutoTokenizer
+
+        path = model_path(model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.batch_size = batch_size
+        self.max_length = max_length
+        onnx_path = export_path(model_name, quantize, onnx_dir)
+        if not os.path.exists(onnx_path):
+            export_onnx(
+                bge_m3_module(path),
+                ["input_ids", "attention_mask"],
+                ["dense", "sparse"],
+                {
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "dense": {0: "batch"},
+                    "sparse": {0: "batch", 1: "sequence"},
+                },
+                onnx_path,
+                quantize,
+            )
+        self.session = load_session(onnx_path, threads)
+        tokenizer = self.tokenizer
+        self.unused_tokens = {
+            tokenizer.cls_token_id,
+            tokenizer.eos_token_id,
+            tokenizer.pad_token_id,
+            tokenizer.unk_token_id,
+        }
+
+    def lexical_weights(self, input_ids, weights) -> Dict[str, float]:
+        # Same as FlagEmbedding: the largest weight of each token id, leaving
+        # out special tokens and zero weights
+        result = {}
+        for token_id, weight in zip(input_ids.tolist(), weights.tolist()):
+            if token_id in self.unused_tokens or weight <= 0:
+                continue
+            key = str(token_id)
+            if weight > result.get(key, 0):
+                result[key] = weight
+        return result
+
+    def encode(
+        self,
+        texts: List[str],
+        max_length: Optional[int] = None,
+        return_dense: bool = True,
+        return_sparse: bool = False,
+        return_colbert_vecs: bool = False,
+    ) -> dict:
+        if return_colbert_vecs:
+            raise ValueError("ColBERT vectors are not supported by the ONNX backend")
+        if isinstance(texts, str):
+            texts = [texts]
+        encoded = self.tokenizer(
+            texts, truncation=True, max_length=max_length or self.max_length
+        )
+        dense: List = [None] * len(texts)
+        sparse: List = [None] * len(texts)
+        lengths = [len(input_ids) for input_ids in encoded["input_ids"]]
+        for batch in length_sorted_batches(lengths, self.batch_size):
+            inputs = self.tokenizer.pad(
+                {"input_ids": [encoded["input_ids"][index] for index in batch]},
+                return_tensors="np",
+            )
+            input_ids = inputs["input_ids"].astype(np.int64)
+            dense_vecs, token_weights = self.session.run(
+                None,
+                {
+                    "input_ids": input_ids,
+                    "attention_mask": inputs["attention_mask"].astype(np.int64),
+                },
+            )
+            for row, index in enumerate(batch):
+                dense[index] = dense_vecs[row]
+                if return_sparse:
+                    sparse[index] = self.lexical_weights(
+                        input_ids[row], token_weights[row]
+                    )
+
+        output = {"dense_vecs": None, "lexical_weights": None, "colbert_vecs": None}
+        if return_dense:
+            output["dense_vecs"] = np.stack(dense) if dense else np.zeros((0, 0))
+        if return_sparse:
+            output["lexical_weights"] = sparse
+        return output
+
+
+def cross_encoder_module(path: str):
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    class CrossEncoderLogits(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = AutoModelForSequenceClassification.from_pretrained(path)
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+    return CrossEncoderLogits()
+
+
+# A sequence-classification cross-encoder on ONNX Runtime. Scores go through a
+# sigmoid like sentence-transformers' CrossEncoder does for single-label
+# models, so they are interchangeable with HuggingFaceCrossEncoder scores.
+class ONNXCrossEncoder(BaseCrossEncoder):
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = True,
+        onnx_dir: str = ONNX_DIR,
+        batch_size: int = BATCH_SIZE,
+        max_length: Optional[int] = None,
+        threads: Optional[int] = None,
+    ):
+        from transformers import AutoTokenizer
+
+        path = model_path(model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.batch_size = batch_size
+        self.max_length = max_length
+        onnx_path = export_path(model_name, quantize, onnx_dir)
+        if not os.path.exists(onnx_path):
+            export_onnx(
+                cross_encoder_module(path),
+                ["input_ids", "attention_mask"],
+                ["logits"],
+                {
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "logits": {0: "batch"},
+                },
+                onnx_path,
+                quantize,
+            )
+        self.session = load_session(onnx_path, threads)
+
+    def score(self, text_pairs: List[Tuple[str, str]]) -> List[float]:
+        if not text_pairs:
+            return []
+        encoded = self.tokenizer(
+            [query for query, _ in text_pairs],
+            [document for _, document in text_pairs],
+            truncation="longest_first",
+            max_length=self.max_length,
+        )
+        scores: List = [None] * len(text_pairs)
+        lengths = [len(input_ids) for input_ids in encoded["input_ids"]]
+        for batch in length_sorted_batches(lengths, self.batch_size):
+            inputs = self.tokenizer.pad(
+                {"input_ids": [encoded["input_ids"][index] for index in batch]},
+                return_tensors="np",
+            )
+            (logits,) = self.session.run(
+                None,
+                {
+                    "input_ids": inputs["input_ids"].astype(np.int64),
+                    "attention_mask": inputs["attention_mask"].astype(np.int64),
+                },
+            )
+            for row, index in enumerate(batch):
+                scores[index] = float(1 / (1 + np.exp(-logits[row, 0])))
+        return scores
+
+
+# Identifies what produces the vectors, so vectors persisted by one model,
+# backend or precision are never served for another. The device is left out,
+# a backend gives the same vectors on any device up to float rounding.
+def bge_m3_encoder_id(
+    model_name: str = BGE_M3_MODEL, backend: str = "auto", device: Optional[str] = None
+) -> str:
+    backend = resolve_backend(backend, device or detect_device())
+    # load_bge_m3 always loads the quantized ONNX export
+    precision = "int8" if backend == "onnx" else "fp32"
+    return f"{model_name}:{backend}:{precision}:{MAX_LENGTH}"
+
+
+def load_bge_m3(
+    model_name: str = BGE_M3_MODEL,
+    backend: str = "auto",
+    device: Optional[str] = None,
+):
+    device = device or detect_device()
+    if resolve_backend(backend, device) == "onnx":
+        return ONNXBGEM3Model(model_name)
+    from FlagEmbedding import BGEM3FlagModel
+
+    return BGEM3FlagModel(model_name, devices=device)
+
+
+def load_cross_encoder(
+    model_name: str, backend: str = "auto", device: Optional[str] = None
+) -> BaseCrossEncoder:
+    device = device or detect_device()
+    if resolve_backend(backend, device) == "onnx":
+        return ONNXCrossEncoder(model_name)
+    from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+
+    return HuggingFaceCrossEncoder(
+        model_name=model_name, model_kwargs={"device": device}
+    )
@@ -0,0 +1,23 @@
+import os
+
+from qdrant_client import QdrantClient
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# A directory for embedded Qdrant. When set, the collection is stored and
+# searched in-process instead of on the server started by run_qdrant.sh.
+QDRANT_PATH = os.getenv("QDRANT_PATH")
+
+
+# Embedded (local mode) Qdrant runs the same prefetch and reciprocal-rank fusion
+# query as the server, so RetrievalMode.HYBRID behaves the same on both. It
+# searches by brute force, which keeps small collections at millisecond
+# latency with no network hop, but the directory is locked by the process that
+# opens it: embed_incidents.py and the agent cannot have it open at once.
+def client_options() -> dict:
+    if QDRANT_PATH:
+        return {"path": os.path.abspath(QDRANT_PATH)}
+    return {"url": QDRANT_URL, "prefer_grpc": True}
+
+
+def create_client() -> QdrantClient:
+    return QdrantClient(**client_options())
@@ -0,0 +1,214 @@
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_qdrant import QdrantVectorStore, SparseVector
+
+QueryVectors = Tuple[List[float], SparseVector]
+
+
+def normalize_query(text: str) -> str:
+    # Resubmitted descriptions differ in case, spacing and unicode forms
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class LRUCache:
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value, stored_at: Optional[float] = None):
+        with self.lock:
+            self.entries[key] = (value, time.time() if stored_at is None else stored_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Query vectors depend only on the encoder, so they are kept until evicted and
+# optionally written through to SQLite to survive restarts. Persisted vectors
+# are dropped when a process starts with another `encoder` id, such as torch
+# after the int8 ONNX model. Retrieval results (the reranked point ids) depend
+# on the collection: they expire after `ttl` seconds, are dropped by
+# invalidate() when the collection is re-synced, and are never persisted
+# because a sync may have run while the process was down.
+class QueryCache:
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: Optional[float] = 3600,
+        path: Optional[str] = None,
+        encoder: str = "",
+    ):
+        self.vectors = LRUCache(max_size)
+        self.results = LRUCache(max_size, ttl)
+        self.generation = 0
+        self.hits = {"vectors": 0, "results": 0}
+        self.misses = {"vectors": 0, "results": 0}
+        self.conn = None
+        self.conn_lock = threading.Lock()
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS QUERY_VECTORS (
+                query TEXT PRIMARY KEY,
+                dense TEXT NOT NULL,
+                sparse TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )
+            """
+            )
+            self.conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS QUERY_CACHE_META (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+            """
+            )
+            self.check_encoder(encoder)
+            self.conn.commit()
+            self.load(max_size)
+
+    def check_encoder(self, encoder: str):
+        row = self.conn.execute(
+            "SELECT value FROM QUERY_CACHE_META WHERE key = 'encoder'"
+        ).fetchone()
+        if row is not None and row[0] == encoder:
+            return
+        # Tables written before the encoder was recorded are dropped as well
+        self.conn.execute("DELETE FROM QUERY_VECTORS")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO QUERY_CACHE_META (key, value) "
+            "VALUES ('encoder', ?)",
+            (encoder,),
+        )
+
+    def load(self, max_size: int):
+        rows = self.conn.execute(
+            "SELECT query, dense, sparse, stored_at FROM QUERY_VECTORS "
+            "ORDER BY stored_at DESC LIMIT ?",
+            (max_size,),
+        ).fetchall()
+        # Oldest first, so the most recent queries end up least likely evicted
+        for query, dense, sparse, stored_at in reversed(rows):
+            indices, values = json.loads(sparse)
+            self.vectors.put(
+                query,
+                (json.loads(dense), SparseVector(indices=indices, values=values)),
+                stored_at,
+            )
+
+    def get_vectors(self, text: str) -> Optional[QueryVectors]:
+        vectors = self.vectors.get(normalize_query(text))
+        self._count("vectors", vectors)
+        return vectors
+
+    def put_vectors(self, text: str, vectors: QueryVectors):
+        query = normalize_query(text)
+        self.vectors.put(query, vectors)
+        if self.conn is None:
+            return
+        dense, sparse = vectors
+        with self.conn_lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO QUERY_VECTORS (query, dense, sparse, stored_at) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    query,
+                    json.dumps(dense),
+                    json.dumps([sparse.indices, sparse.values]),
+                    time.time(),
+                ),
+            )
+            self.conn.commit()
+
+    def get_results(self, text: str, *variant) -> Optional[List]:
+        point_ids = self.results.get((normalize_query(text), *variant))
+        self._count("results", point_ids)
+        return point_ids
+
+    # Readers pass the generation they saw before searching, so results of a
+    # search that raced with an invalidation are returned but never cached.
+    def put_results(self, text: str, point_ids: List, generation: int, *variant):
+        if generation == self.generation:
+            self.results.put((normalize_query(text), *variant), point_ids)
+
+    def invalidate(self):
+        self.generation += 1
+        self.results.clear()
+
+    def stats(self) -> dict:
+        return {
+            "generation": self.generation,
+            "vectors": len(self.vectors),
+            "results": len(self.results),
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+        }
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+    def _count(self, kind: str, value):
+        if value is None:
+            self.misses[kind] += 1
+        else:
+            self.hits[kind] += 1
+
+
+# Cached results hold point ids only and the documents are re-read from Qdrant
+# in a single lookup, so a hit always returns the current content. A point
+# deleted since the search makes the whole entry a miss.
+def documents_by_id(
+    knowledge_base: QdrantVectorStore, point_ids: List
+) -> Optional[List[Document]]:
+    points = knowledge_base.client.retrieve(
+        knowledge_base.collection_name, ids=point_ids, with_payload=True
+    )
+    if len(points) != len(point_ids):
+        return None
+    by_id = {str(point.id): point for point in points}
+    documents = []
+    for point_id in point_ids:
+        point = by_id[str(point_id)]
+        payload = point.payload or {}
+        documents.append(
+            Document(
+                page_content=payload.get(knowledge_base.content_payload_key, ""),
+                metadata={
+                    **(payload.get(knowledge_base.metadata_payload_key) or {}),
+                    "_id": point.id,
+                    "_collection_name": knowledge_base.collection_name,
+                },
+            )
+        )
+    return documents
@@ -1,40 +1,33 @@
+import json
+from typing import Optional, Tuple
+
 from langchain.callbacks.tracers import ConsoleCallbackHandler
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.chains.retrieval import create_retrieval_chain
-from langchain.retrievers import ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import CrossEncoderReranker
-from langchain_community.cross_encoders import HuggingFaceCrossEncoder
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import ConfigurableField
 from langchain_ollama.llms import OllamaLLM
 from langchain_qdrant import RetrievalMode, QdrantVectorStore
 
-from qdrant.bge_sparse_embeddings import BGEM3SparseEmbeddings
-
-llm = OllamaLLM(model="gemma3:12b-it-q8_0", temperature=0)
-embeddings = HuggingFaceEmbeddings(
-    model_name="BAAI/bge-m3", model_kwargs={"device": "mps"}
-)
-sparse_embeddings = BGEM3SparseEmbeddings()
-knowledge_base = QdrantVectorStore.from_existing_collection(
-    embedding=embeddings,
-    sparse_embedding=sparse_embeddings,
-    url=f"http://localhost:6333",
-    prefer_grpc=True,
-    collection_name="incidents",
-    retrieval_mode=RetrievalMode.HYBRID,
-)
-reranker = HuggingFaceCrossEncoder(model_name="BAAI/bge-reranker-v2-m3")
-
-
-def retrieve_and_analyze_incident(incident_description):
-    base_retriever = knowledge_base.as_retriever(search_kwargs={"k": 10})
-    compression_retriever = ContextualCompressionRetriever(
-        base_compressor=CrossEncoderReranker(model=reranker, top_n=4),
-        base_retriever=base_retriever,
-    )
+from qdrant.bge_sparse_embeddings import BGEM3Embeddings
+from qdrant.inference import bge_m3_encoder_id, load_bge_m3, load_cross_encoder
+from qdrant.storage import client_options
+from query_cache import QueryCache
+from retrieval import AdaptiveRerankRetriever
 
-    system_prompt = """
+COLLECTION_NAME = "incidents"
+LLM_MODEL = "gemma3:12b-it-q8_0"
+RERANKER_MODEL = "BAAI/bge-reranker-v2-m3"
+SEARCH_K = 10
+RERANK_TOP_N = 4
+# Relative hybrid score gap for adaptive reranking, None always reranks all k
+SCORE_GAP = None
+# "torch", "onnx" (int8 ONNX Runtime on CPU) or "auto" to pick by device
+INFERENCE_BACKEND = "auto"
+# The answer SYSTEM_PROMPT asks for when the context does not settle a field
+CANNOT_DETERMINE = "CANNOT_DETERMINE"
+
+SYSTEM_PROMPT = """
         You are an e-commerce incident analysis assistant. You'll analyze the provided incident description and use the retrieved similar past incidents to determine the most probable root cause analysis (RCA) and resolution.
         
         The retrieved context contains similar past incidents with their descriptions, actions taken, resolutions, and root cause analyses. Use this information to make an informed assessment of the current incident.
@@ -55,15 +48,105 @@ def retrieve_and_analyze_incident(incident_description):
         }}
     """
 
+
+def load_llm():
+    return OllamaLLM(model=LLM_MODEL, temperature=0)
+
+
+def load_embeddings(backend: str = INFERENCE_BACKEND):
+    return BGEM3Embeddings(model=load_bge_m3(backend=backend))
+
+
+def embeddings_id(backend: str = INFERENCE_BACKEND) -> str:
+    return bge_m3_encoder_id(backend=backend)
+
+
+def load_reranker(backend: str = INFERENCE_BACKEND):
+    return load_cross_encoder(RERANKER_MODEL, backend)
+
+
+def load_knowledge_base(embeddings, sparse_embeddings):
+    return QdrantVectorStore.from_existing_collection(
+        embedding=embeddings,
+        sparse_embedding=sparse_embeddings,
+        **client_options(),
+        collection_name=COLLECTION_NAME,
+        retrieval_mode=RetrievalMode.HYBRID,
+    )
+
+
+def build_retriever(
+    knowledge_base,
+    reranker,
+    k: int = SEARCH_K,
+    top_n: int = RERANK_TOP_N,
+    score_gap: Optional[float] = SCORE_GAP,
+    cache: Optional[QueryCache] = None,
+):
+    return AdaptiveRerankRetriever(
+        knowledge_base=knowledge_base,
+        reranker=reranker,
+        k=k,
+        top_n=top_n,
+        score_gap=score_gap,
+        cache=cache,
+    )
+
+
+def build_analysis_chain(llm):
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", system_prompt),
+            ("system", SYSTEM_PROMPT),
             ("human", "New incident description: {input}"),
         ]
     )
 
-    incident_analysis_chain = create_stuff_documents_chain(llm, prompt)
-    rag_chain = create_retrieval_chain(compression_retriever, incident_analysis_chain)
+    return create_stuff_documents_chain(llm, prompt)
+
+
+# k, top_n and score_gap can be overridden per call with
+# config={"configurable": {"k": 20, "top_n": 4, "score_gap": 0.2}}
+def build_chain(
+    knowledge_base,
+    reranker,
+    llm,
+    cache: Optional[QueryCache] = None,
+    score_gap: Optional[float] = SCORE_GAP,
+):
+    retriever = build_retriever(
+        knowledge_base, reranker, score_gap=score_gap, cache=cache
+    ).configurable_fields(
+        k=ConfigurableField(id="k"),
+        top_n=ConfigurableField(id="top_n"),
+        score_gap=ConfigurableField(id="score_gap"),
+    )
+    return create_retrieval_chain(retriever, build_analysis_chain(llm))
+
+
+def parse_analysis(answer: str) -> Tuple[Optional[str], Optional[str]]:
+    # The model is asked for JSON but may wrap it in a code fence or prose
+    start, end = answer.find("{"), answer.rfind("}")
+    if start == -1 or end < start:
+        return None, None
+    try:
+        parsed = json.loads(answer[start : end + 1])
+    except json.JSONDecodeError:
+        return None, None
+    if not isinstance(parsed, dict):
+        return None, None
+    rca, resolution = parsed.get("rca"), parsed.get("resolution")
+    return (
+        rca if isinstance(rca, str) else None,
+        resolution if isinstance(resolution, str) else None,
+    )
+
+
+def is_undetermined(value: str) -> bool:
+    # The prompt quotes the placeholder, so the model sometimes echoes quotes
+    return value.strip().strip("'\"").upper() == CANNOT_DETERMINE
+
+
+def retrieve_and_analyze_incident(rag_chain, incident_description):
     response = rag_chain.invoke(
         {"input": incident_description},
         config={"callbacks": [ConsoleCallbackHandler()]},
@@ -71,14 +154,22 @@ def retrieve_and_analyze_incident(incident_description):
     return response.get("answer")
 
 
-print(
-    retrieve_and_analyze_incident(
-        "The website is down and customers are unable to place orders."
+if __name__ == "__main__":
+    embeddings = load_embeddings()
+    rag_chain = build_chain(
+        load_knowledge_base(embeddings, embeddings.sparse),
+        load_reranker(),
+        load_llm(),
+    )
+
+    print(
+        retrieve_and_analyze_incident(
+            rag_chain, "The website is down and customers are unable to place orders."
+        )
     )
-)
 
-print(
-    retrieve_and_analyze_incident(
-        "Price mismatch between the product page and the checkout page"
+    print(
+        retrieve_and_analyze_incident(
+            rag_chain, "Price mismatch between the product page and the checkout page"
+        )
     )
-)
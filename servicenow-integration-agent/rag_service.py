@@ -0,0 +1,161 @@
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional, Union
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+
+import rag_search
+from micro_batch import BatchedCrossEncoder, BatchedQueryEmbeddings
+from query_cache import QueryCache
+
+MAX_BATCH_SIZE = int(os.getenv("RAG_MAX_BATCH_SIZE", "32"))
+MAX_WAIT_SECONDS = float(os.getenv("RAG_MAX_WAIT_MS", "5")) / 1000
+BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "4"))
+WARM_UP = os.getenv("RAG_WARM_UP", "true").lower() in ("1", "true", "yes")
+# Relative hybrid score gap for adaptive reranking, unset always reranks all k
+SCORE_GAP = float(os.environ["RAG_SCORE_GAP"]) if os.getenv("RAG_SCORE_GAP") else None
+# "torch", "onnx" or "auto" (ONNX Runtime on CPU-only hosts)
+INFERENCE_BACKEND = os.getenv("RAG_INFERENCE_BACKEND", rag_search.INFERENCE_BACKEND)
+CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("RAG_CACHE_TTL_SECONDS", "3600"))
+# Query vectors are written through to this SQLite file when set
+CACHE_PATH = os.getenv("RAG_CACHE_PATH")
+
+
+class RetrievalOptions(BaseModel):
+    k: Optional[int] = Field(default=None, ge=1, le=100)
+    top_n: Optional[int] = Field(default=None, ge=1, le=20)
+    score_gap: Optional[float] = Field(default=None, ge=0, le=1)
+
+    def config(self) -> dict:
+        # Only options the client sent override the chain defaults, so an
+        # explicit null score_gap turns adaptive reranking off
+        options = self.model_dump(
+            include=set(RetrievalOptions.model_fields), exclude_unset=True
+        )
+        return {"configurable": options}
+
+
+class AnalyzeRequest(RetrievalOptions):
+    description: str = Field(min_length=1)
+
+
+class BatchAnalyzeRequest(RetrievalOptions):
+    descriptions: List[str] = Field(min_length=1, max_length=100)
+
+
+class Analysis(BaseModel):
+    rca: Optional[str] = None
+    resolution: Optional[str] = None
+    answer: str
+    incident_ids: List[Union[int, str]]
+
+
+# Loads the models once per process and builds the chain around batching
+# wrappers, so concurrent analyses share embedding and rerank forward passes.
+class Analyzer:
+    def __init__(self):
+        self.cache = QueryCache(
+            CACHE_SIZE,
+            CACHE_TTL_SECONDS,
+            CACHE_PATH,
+            rag_search.embeddings_id(INFERENCE_BACKEND),
+        )
+        self.llm = rag_search.load_llm()
+        self.embeddings = BatchedQueryEmbeddings(
+            rag_search.load_embeddings(INFERENCE_BACKEND),
+            MAX_BATCH_SIZE,
+            MAX_WAIT_SECONDS,
+            self.cache,
+        )
+        self.reranker = BatchedCrossEncoder(
+            rag_search.load_reranker(INFERENCE_BACKEND),
+            MAX_BATCH_SIZE,
+            MAX_WAIT_SECONDS,
+        )
+        self.knowledge_base = rag_search.load_knowledge_base(
+            self.embeddings, self.embeddings.sparse
+        )
+        self.chain = rag_search.build_chain(
+            self.knowledge_base, self.reranker, self.llm, self.cache, SCORE_GAP
+        )
+
+    def warm_up(self):
+        # The first forward pass allocates device memory and compiles kernels,
+        # and Ollama loads the model on its first prompt. Paying for both here
+        # keeps that latency out of the first real request.
+        self.embeddings.embeddings.encode(["warm up"])
+        self.reranker.cross_encoder.score([("warm up", "warm up")])
+        self.knowledge_base.similarity_search("warm up", k=1)
+        self.llm.invoke("Reply with OK.")
+
+    def close(self):
+        self.embeddings.close()
+        self.reranker.close()
+        self.knowledge_base.client.close()
+        self.cache.close()
+
+
+def to_analysis(response: dict) -> Analysis:
+    answer = response.get("answer", "")
+    rca, resolution = rag_search.parse_analysis(answer)
+    return Analysis(
+        rca=rca,
+        resolution=resolution,
+        answer=answer,
+        incident_ids=[
+            document.metadata["incident_id"]
+            for document in response.get("context", [])
+            if "incident_id" in document.metadata
+        ],
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    analyzer = await run_in_threadpool(Analyzer)
+    if WARM_UP:
+        await run_in_threadpool(analyzer.warm_up)
+    app.state.analyzer = analyzer
+    yield
+    analyzer.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.post("/analyze", response_model=Analysis)
+async def analyze(body: AnalyzeRequest, request: Request):
+    response = await request.app.state.analyzer.chain.ainvoke(
+        {"input": body.description}, config=body.config()
+    )
+    return to_analysis(response)
+
+
+@app.post("/analyze/batch", response_model=List[Analysis])
+async def analyze_batch(body: BatchAnalyzeRequest, request: Request):
+    responses = await request.app.state.analyzer.chain.abatch(
+        [{"input": description} for description in body.descriptions],
+        config={**body.config(), "max_concurrency": BATCH_CONCURRENCY},
+    )
+    return [to_analysis(response) for response in responses]
+
+
+# Called by qdrant/embed_incidents.py after a sync changes the collection
+@app.post("/cache/invalidate")
+async def invalidate_cache(request: Request):
+    cache = request.app.state.analyzer.cache
+    cache.invalidate()
+    return {"generation": cache.generation}
+
+
+@app.get("/cache/stats")
+async def cache_stats(request: Request):
+    return request.app.state.analyzer.cache.stats()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
@@ -0,0 +1,80 @@
+from typing import List, Optional, Tuple
+
+from langchain.retrievers.document_compressors.cross_encoder import BaseCrossEncoder
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_qdrant import QdrantVectorStore
+
+from query_cache import QueryCache, documents_by_id
+
+Candidates = List[Tuple[Document, float]]
+
+
+def contested_count(scores: List[float], score_gap: Optional[float]) -> int:
+    # Candidates scoring within `score_gap` (relative to the top hybrid score)
+    # of the winner are close enough that the cross-encoder has to order them.
+    if score_gap is None or not scores:
+        return len(scores)
+    threshold = scores[0] - score_gap * abs(scores[0])
+    return sum(1 for score in scores if score >= threshold)
+
+
+# Hybrid search for `k` candidates, cross-encoder rerank down to `top_n`.
+# With `score_gap` set the rerank is adaptive: only the candidates contesting
+# the top hybrid score are scored, and when the winner is clear the rerank is
+# skipped and the hybrid order is kept. A score_gap of 1 reranks every
+# candidate, 0 only reranks ties. Every field can be set per request through
+# the chain's configurable fields.
+class AdaptiveRerankRetriever(BaseRetriever):
+    knowledge_base: QdrantVectorStore
+    reranker: BaseCrossEncoder
+    k: int = 10
+    top_n: int = 4
+    score_gap: Optional[float] = None
+    cache: Optional[QueryCache] = None
+
+    def search(self, query: str) -> Candidates:
+        return self.knowledge_base.similarity_search_with_score(query, k=self.k)
+
+    def rerank(self, query: str, candidates: Candidates) -> List[Document]:
+        contested = contested_count([score for _, score in candidates], self.score_gap)
+        for document, score in candidates:
+            document.metadata["hybrid_score"] = score
+            document.metadata["rerank_score"] = None
+        if contested <= 1:
+            return [document for document, _ in candidates[: self.top_n]]
+
+        head = [document for document, _ in candidates[:contested]]
+        scores = self.reranker.score(
+            [(query, document.page_content) for document in head]
+        )
+        for document, score in zip(head, scores):
+            document.metadata["rerank_score"] = float(score)
+        head.sort(key=lambda document: document.metadata["rerank_score"], reverse=True)
+        # Candidates outside the contested set keep their hybrid order
+        tail = [document for document, _ in candidates[contested:]]
+        return (head + tail)[: self.top_n]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        variant = (self.k, self.top_n, self.score_gap)
+        if self.cache is None:
+            return self.rerank(query, self.search(query))
+
+        point_ids = self.cache.get_results(query, *variant)
+        if point_ids is not None:
+            documents = documents_by_id(self.knowledge_base, point_ids)
+            if documents is not None:
+                return documents
+
+        generation = self.cache.generation
+        documents = self.rerank(query, self.search(query))
+        self.cache.put_results(
+            query,
+            [document.metadata["_id"] for document in documents],
+            generation,
+            *variant,
+        )
+        return documents
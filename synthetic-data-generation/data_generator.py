@@ -1,10 +1,15 @@
-import time
+import argparse
+import asyncio
 from typing import List
 
 from pydantic import BaseModel
 
-from llm import generate_deepseek, generate_gemini, generate_openai
-from store import get_scenario_to_generate, update_scenario
+from generation_engine import (
+    PROVIDER_LIMITS,
+    benchmark,
+    build_providers,
+    generate_scenarios,
+)
 
 
 class Dataset(BaseModel):
@@ -119,64 +124,64 @@ system_prompt = """
     }
 """
 
-generator = "gemini"  # Options: "openai", "deepseek", "gemini"
+PROVIDERS = ["openai", "deepseek", "gemini"]
+SCENARIOS = 100
 
 
 def main():
-    total_requests = 0
-    minute_requests = 0
-    minute_start_time = time.time()
-
-    while total_requests < 100:
-        current_time = time.time()
-        if current_time - minute_start_time >= 60:
-            minute_requests = 0
-            minute_start_time = current_time
-
-        if minute_requests >= 10:
-            sleep_time = 60 - (current_time - minute_start_time)
-            if sleep_time > 0:
-                print(f"Rate limit reached. Sleeping for {sleep_time:.2f} seconds...")
-                time.sleep(sleep_time)
-                minute_requests = 0
-                minute_start_time = time.time()
-
-        scenario = get_scenario_to_generate("DESC" if generator == "gemini" else "ASC")
-        if scenario is None:
-            print("No more scenarios to generate. Exiting.")
-            break
-
-        print(
-            f"Generating datasets for scenario {scenario['scenario']} with id {scenario['id']}..."
-        )
-
-        try:
-            prompt = f"Scenario: {scenario['scenario']}"
-            match generator:
-                case "openai":
-                    datasets = generate_openai(system_prompt, prompt, DatasetList)
-                case "deepseek":
-                    datasets = generate_deepseek(system_prompt, prompt, DatasetList)
-                case "gemini":
-                    datasets = generate_gemini(system_prompt, prompt, DatasetList)
-                case _:
-                    raise ValueError(f"Unknown generator: {generator}")
-
-            update_scenario(scenario, datasets)
-
-            total_requests += 1
-            minute_requests += 1
-
-            print(
-                f"Generated datasets for scenario {scenario['id']}. Total requests: {total_requests}"
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic incident datasets for pending scenarios."
+    )
+    parser.add_argument(
+        "--providers",
+        default=",".join(PROVIDERS),
+        help="Comma separated providers used at the same time "
+        f"({', '.join(PROVIDER_LIMITS)})",
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=int,
+        default=SCENARIOS,
+        help="Pending scenarios to generate in this run",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Requests in flight per provider (default: per-provider limit)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Scenarios claimed from the store at a time (default: total "
+        "concurrency)",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Generate --scenarios placeholder scenarios with the mock provider "
+        "in a temporary database",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        asyncio.run(
+            benchmark(
+                system_prompt,
+                DatasetList,
+                args.scenarios,
+                args.concurrency,
+                args.batch_size,
             )
-
-        except Exception as e:
-            print(f"Error generating datasets for scenario {scenario['id']}: {str(e)}")
-            total_requests += 1
-            minute_requests += 1
-
-    print(f"Completed with {total_requests} total requests.")
+        )
+        return
+    providers = build_providers(
+        [name.strip() for name in args.providers.split(",")], args.concurrency
+    )
+    asyncio.run(
+        generate_scenarios(
+            system_prompt, DatasetList, providers, args.scenarios, args.batch_size
+        )
+    )
 
 
 if __name__ == "__main__":
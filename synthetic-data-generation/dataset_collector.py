@@ -1,10 +1,17 @@
-import json
-from typing import List
+import argparse
+import os
+import shutil
+import tempfile
+from typing import Iterator, List, Optional, Tuple
 
 from pydantic import BaseModel
 
-from data_generator import DatasetList
-from store import get_all_scenario_datasets
+from dedup import THRESHOLD as DEDUP_THRESHOLD
+from dedup import add_dedup_arguments, iter_unique_datasets
+
+OUTPUT_DIR = "../model-training/dataset"
+SHARD_PREFIX = "train-"
+SHARD_SIZE = 50_000
 
 
 class PromptContent(BaseModel):
@@ -33,29 +40,106 @@ Below is an incident with two fields: "issueDescription" and "actionsTaken."
 """
 
 
+def iter_training_examples(
+    dedup_threshold: Optional[float] = DEDUP_THRESHOLD,
+    dedup_report: Optional[str] = None,
+) -> Iterator[TrainingExample]:
+    for dataset in iter_unique_datasets(dedup_threshold, dedup_report):
+        prompt_content = PromptContent(
+            issueDescription=dataset.issueDescription,
+            actionsTaken=dataset.actionsTaken,
+        )
+        completion_content = CompletionContent(
+            rca=dataset.rca, resolution=dataset.resolution
+        )
+        yield TrainingExample(
+            prompt=f"{prompt_template}\n{prompt_content.model_dump_json()}",
+            completion=completion_content.model_dump_json(),
+        )
+
+
+def open_shard(path: str, compress: bool):
+    if not compress:
+        return open(path, "w", encoding="utf-8")
+    import zstandard
+
+    return zstandard.open(path, "w", encoding="utf-8")
+
+
+# Writes examples as compact JSONL shards of `shard_size` lines straight from
+# the store cursor, so memory stays flat however large the corpus is. Shards
+# are written to a staging directory next to the export and only replace the
+# shards of the previous export once every example has been written, so a
+# failed run leaves the last good export in place.
+def write_shards(
+    examples: Iterator[TrainingExample],
+    output_dir: str = OUTPUT_DIR,
+    shard_size: int = SHARD_SIZE,
+    compress: bool = False,
+) -> Tuple[int, int]:
+    os.makedirs(output_dir, exist_ok=True)
+    # Inside output_dir, so promoting a shard is a rename on the same filesystem
+    staging_dir = tempfile.mkdtemp(prefix=".export-", dir=output_dir)
+    extension = ".jsonl.zst" if compress else ".jsonl"
+    shard_names = []
+    written = 0
+    shard = None
+    try:
+        for example in examples:
+            if written % shard_size == 0:
+                if shard is not None:
+                    shard.close()
+                shard_names.append(f"{SHARD_PREFIX}{len(shard_names):05d}{extension}")
+                shard = open_shard(os.path.join(staging_dir, shard_names[-1]), compress)
+            shard.write(example.model_dump_json() + "\n")
+            written += 1
+        if shard is not None:
+            shard.close()
+    except BaseException:
+        if shard is not None:
+            shard.close()
+        shutil.rmtree(staging_dir)
+        raise
+
+    for name in os.listdir(output_dir):
+        if name.startswith(SHARD_PREFIX):
+            os.remove(os.path.join(output_dir, name))
+    for name in shard_names:
+        os.replace(os.path.join(staging_dir, name), os.path.join(output_dir, name))
+    os.rmdir(staging_dir)
+    return len(shard_names), written
+
+
 def main():
-    training_examples = []
-    datasets_raw = get_all_scenario_datasets()
-
-    for dataset_raw in datasets_raw:
-        dataset_list = DatasetList.model_validate_json(dataset_raw)
-        for dataset in dataset_list.datasets:
-            prompt_content = PromptContent(
-                issueDescription=dataset.issueDescription,
-                actionsTaken=dataset.actionsTaken,
-            )
-            completion_content = CompletionContent(
-                rca=dataset.rca, resolution=dataset.resolution
-            )
-            training_examples.append(
-                TrainingExample(
-                    prompt=f"{prompt_template}\n{prompt_content.model_dump_json()}",
-                    completion=completion_content.model_dump_json(),
-                )
-            )
-    training_data = [example.model_dump() for example in training_examples]
-    with open("../model-training/dataset.json", "w") as f:
-        json.dump(training_data, f, indent=4)
+    parser = argparse.ArgumentParser(
+        description="Export generated datasets as JSONL training shards."
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=OUTPUT_DIR,
+        help="Directory the shards are written to",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=SHARD_SIZE,
+        help="Training examples per shard",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Compress the shards with zstd (requires the zstandard package)",
+    )
+    add_dedup_arguments(parser)
+    args = parser.parse_args()
+
+    examples = iter_training_examples(
+        None if args.no_dedup else args.dedup_threshold, args.dedup_report
+    )
+    shards, written = write_shards(
+        examples, args.output_dir, args.shard_size, args.compress
+    )
+    print(f"Wrote {written} training examples to {shards} shards in {args.output_dir}.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,267 @@
+import argparse
+import json
+import re
+import sqlite3
+import zlib
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from data_generator import Dataset, DatasetList
+from store import iter_generated_scenarios, snapshot
+
+THRESHOLD = 0.8
+NUM_PERM = 128
+SHINGLE_SIZE = 3
+SEED = 1
+# Probability that a pair exactly at the threshold shares an LSH band. Every
+# candidate is checked against the threshold again, so missed pairs cost far
+# more than extra candidates.
+LSH_RECALL = 0.95
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+TOKEN = re.compile(r"\w+")
+
+DatasetKey = Tuple[int, int]
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    tokens = TOKEN.findall(text.lower())
+    if len(tokens) <= size:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i : i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def dataset_text(dataset: Dataset) -> str:
+    return f"{dataset.issueDescription} {dataset.rca}"
+
+
+# Picks b bands of r rows (b * r <= num_perm). A pair with similarity s shares
+# at least one band with probability 1 - (1 - s^r)^b, and the most rows per
+# band that still reach `recall` at the threshold keep the fewest candidates.
+def lsh_bands(
+    threshold: float, num_perm: int, recall: float = LSH_RECALL
+) -> Tuple[int, int]:
+    for rows in range(num_perm, 0, -1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold**rows) ** bands >= recall:
+            return bands, rows
+    return num_perm, 1
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, key):
+        root = self.parent.setdefault(key, key)
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while key != root:
+            self.parent[key], key = root, self.parent[key]
+        return root
+
+    # The smaller key becomes the root, so each cluster keeps its earliest record
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+# Near-duplicate detection with MinHash signatures over word shingles and
+# banded LSH. Every record is hashed once and compared only with the records
+# it shares a band bucket with, skipping those already in its cluster, so the
+# work grows with the number of candidate pairs rather than all pairs.
+# Similarity is the MinHash estimate of the Jaccard similarity of the two
+# shingle sets.
+class Deduplicator:
+    def __init__(
+        self,
+        threshold: float = THRESHOLD,
+        num_perm: int = NUM_PERM,
+        shingle_size: int = SHINGLE_SIZE,
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        rng = np.random.RandomState(SEED)
+        self.a = rng.randint(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array(
+            [
+                zlib.crc32(shingle.encode("utf-8"))
+                for shingle in shingles(text, self.shingle_size)
+            ],
+            dtype=np.uint64,
+        )
+        # Universal hashing a*x + b mod p; uint64 overflow wraps on purpose
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME
+        return (permuted & MAX_HASH).min(axis=1).astype(np.uint32)
+
+    def similarity(self, a: np.ndarray, b: np.ndarray) -> float:
+        return float(np.mean(a == b))
+
+    # Returns the clusters of near-duplicates, each a list of (key, similarity
+    # to the kept record) with the kept record, the smallest key, first.
+    def clusters(
+        self, records: Iterable[Tuple[Hashable, str]]
+    ) -> List[List[Tuple[Hashable, float]]]:
+        buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(self.bands)]
+        signatures = {}
+        groups = UnionFind()
+        for key, text in records:
+            signature = self.signature(text)
+            signatures[key] = signature
+            for band, bucket in enumerate(buckets):
+                band_key = signature[band * self.rows : (band + 1) * self.rows]
+                candidates = bucket.setdefault(band_key.tobytes(), [])
+                for other in candidates:
+                    if groups.find(other) != groups.find(key) and (
+                        self.similarity(signature, signatures[other]) >= self.threshold
+                    ):
+                        groups.union(other, key)
+                candidates.append(key)
+
+        members = {}
+        for key in groups.parent:
+            members.setdefault(groups.find(key), []).append(key)
+        clusters = []
+        for root, keys in sorted(members.items()):
+            if len(keys) < 2:
+                continue
+            kept = signatures[root]
+            clusters.append(
+                [(root, 1.0)]
+                + [
+                    (key, round(self.similarity(kept, signatures[key]), 3))
+                    for key in sorted(keys)
+                    if key != root
+                ]
+            )
+        return clusters
+
+
+def iter_keyed_datasets(
+    conn: Optional[sqlite3.Connection] = None,
+) -> Iterator[Tuple[DatasetKey, Dataset]]:
+    for scenario_id, dataset_raw in iter_generated_scenarios(conn=conn):
+        dataset_list = DatasetList.model_validate_json(dataset_raw)
+        for index, dataset in enumerate(dataset_list.datasets):
+            yield (scenario_id, index), dataset
+
+
+def cluster_entry(member: Tuple[DatasetKey, float], texts: dict) -> dict:
+    (scenario_id, index), similarity = member
+    return {
+        "scenario_id": scenario_id,
+        "index": index,
+        "similarity": similarity,
+        "text": texts[(scenario_id, index)],
+    }
+
+
+# Finds near-duplicate datasets in the store. Returns the keys to drop and a
+# report with one entry per cluster of near-duplicates.
+def find_duplicates(
+    threshold: float = THRESHOLD, conn: Optional[sqlite3.Connection] = None
+) -> Tuple[set, dict]:
+    deduplicator = Deduplicator(threshold)
+    texts = {}
+
+    def records():
+        for key, dataset in iter_keyed_datasets(conn):
+            # Only the start of each description is kept for the report
+            texts[key] = dataset.issueDescription[:200]
+            yield key, dataset_text(dataset)
+
+    clusters = deduplicator.clusters(records())
+    dropped = {key for cluster in clusters for key, _ in cluster[1:]}
+    report = {
+        "threshold": threshold,
+        "datasets": len(texts),
+        "clusters": len(clusters),
+        "dropped": len(dropped),
+        "duplicate_clusters": [
+            {
+                "kept": cluster_entry(cluster[0], texts),
+                "dropped": [cluster_entry(member, texts) for member in cluster[1:]],
+            }
+            for cluster in clusters
+        ],
+    }
+    return dropped, report
+
+
+def write_report(report: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def print_summary(report: dict):
+    print(
+        f"Dedup at similarity {report['threshold']}: {report['dropped']} of "
+        f"{report['datasets']} datasets dropped in {report['clusters']} clusters."
+    )
+
+
+# The dedup stage between the store and the collectors: yields every generated
+# dataset except the near-duplicates of an earlier one. The store is read
+# twice, once to find duplicates and once to stream the survivors, so memory
+# holds signatures rather than datasets. Both reads share one snapshot, so
+# datasets generated in between are neither emitted nor missed by dedup.
+# A threshold of None disables dedup.
+def iter_unique_datasets(
+    threshold: Optional[float] = THRESHOLD, report_path: Optional[str] = None
+) -> Iterator[Dataset]:
+    with snapshot() as conn:
+        dropped = set()
+        if threshold is not None:
+            dropped, report = find_duplicates(threshold, conn)
+            print_summary(report)
+            if report_path:
+                write_report(report, report_path)
+        for key, dataset in iter_keyed_datasets(conn):
+            if key not in dropped:
+                yield dataset
+
+
+def add_dedup_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=THRESHOLD,
+        help="Estimated Jaccard similarity at which datasets are near-duplicates",
+    )
+    parser.add_argument(
+        "--no-dedup", action="store_true", help="Keep near-duplicate datasets"
+    )
+    parser.add_argument(
+        "--dedup-report", help="Write the dropped clusters to this JSON file"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report near-duplicate generated datasets."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="Estimated Jaccard similarity at which datasets are near-duplicates",
+    )
+    parser.add_argument("--report", help="Write the dropped clusters to this JSON file")
+    args = parser.parse_args()
+
+    _, report = find_duplicates(args.threshold)
+    print_summary(report)
+    if args.report:
+        write_report(report, args.report)
+
+
+if __name__ == "__main__":
+    main()
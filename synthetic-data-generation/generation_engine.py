@@ -0,0 +1,391 @@
+import asyncio
+import os
+import random
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+import store
+
+# Limits per API credential. Both buckets hold a minute's worth of budget, so
+# the providers of a credential can burst up to its per-minute quota and are
+# then paced at the refill rate.
+CREDENTIAL_LIMITS = {
+    # openai and deepseek both go through the one Azure inference key
+    "copilot": {"requests_per_minute": 10, "tokens_per_minute": 60_000},
+    "gemini": {"requests_per_minute": 15, "tokens_per_minute": 1_000_000},
+    "mock": {"requests_per_minute": 6_000, "tokens_per_minute": 50_000_000},
+}
+# Providers that share a credential share its buckets. `concurrency` is the
+# number of requests a provider keeps in flight at once.
+PROVIDER_LIMITS = {
+    "openai": {"credential": "copilot", "concurrency": 2},
+    "deepseek": {"credential": "copilot", "concurrency": 2},
+    "gemini": {"credential": "gemini", "concurrency": 4},
+    "mock": {"credential": "mock", "concurrency": 32},
+}
+# Output of one request (five datasets), charged up front and settled once the
+# response size is known
+OUTPUT_TOKENS_ESTIMATE = 3_000
+CHARS_PER_TOKEN = 4
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+REQUEST_TIMEOUT_SECONDS = 180.0
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+# Generated datasets are written in batches of this size, or at this interval
+WRITE_BATCH_SIZE = 50
+WRITE_INTERVAL_SECONDS = 5.0
+MOCK_LATENCY_SECONDS = (0.2, 1.0)
+MOCK_ERROR_RATE = 0.05
+
+Generate = Callable[[str, str, Type[BaseModel]], Awaitable[BaseModel]]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# An async token bucket. `acquire` waits until `amount` is available, callers
+# queue on the lock so they are served in order. `consume` charges after the
+# fact and may leave the bucket in debt, which later callers then wait out.
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        # A request larger than the bucket would otherwise never be served
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+
+def status_code(error: Exception) -> Optional[int]:
+    # openai errors carry `status_code`, google-genai errors `code`
+    for attribute in ("status_code", "code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # openai raises APIConnectionError / APITimeoutError without a status
+    if type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return True
+    return status_code(error) in RETRY_STATUSES
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    # Full jitter keeps workers that failed together from retrying together
+    return random.uniform(
+        0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+    )
+
+
+class MockProviderError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"Mock provider returned HTTP {status_code}")
+        self.status_code = status_code
+
+
+# Answers like a real provider, with random latency and injected 429/503
+# errors, so the engine can be benchmarked without API keys or quota
+async def generate_mock(
+    system_prompt: str, prompt: str, response_format: Type[BaseModel]
+) -> BaseModel:
+    await asyncio.sleep(random.uniform(*MOCK_LATENCY_SECONDS))
+    if random.random() < MOCK_ERROR_RATE:
+        raise MockProviderError(random.choice([429, 503]))
+    return response_format.model_validate(
+        {
+            "datasets": [
+                {
+                    "issueDescription": f"{prompt} (variation {index})",
+                    "actionsTaken": ["Checked the account.", "Escalated the issue."],
+                    "resolution": "The issue has been resolved.",
+                    "rca": "RCA Category: Code Issue. Mock root cause.",
+                }
+                for index in range(5)
+            ]
+        }
+    )
+
+
+def load_generate(name: str) -> Generate:
+    if name == "mock":
+        return generate_mock
+    if name not in PROVIDER_LIMITS:
+        raise ValueError(f"Unknown generator: {name}")
+    # llm.py reads the API keys on import, so it is only loaded for real runs
+    import llm
+
+    return getattr(llm, f"agenerate_{name}")
+
+
+class ProviderStats:
+    def __init__(self):
+        self.requests = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.tokens = 0
+        self.seconds = 0.0
+
+    def summary(self, elapsed: float) -> str:
+        mean = self.seconds / self.requests if self.requests else 0.0
+        return (
+            f"{self.succeeded} generated, {self.failed} failed, "
+            f"{self.requests} requests ({self.retried} retries, "
+            f"{self.rate_limited} rate limited), ~{self.tokens} tokens, "
+            f"{mean:.2f}s mean latency, "
+            f"{self.succeeded / elapsed * 60 if elapsed else 0:.1f} scenarios/min"
+        )
+
+
+class Provider:
+    def __init__(
+        self,
+        name: str,
+        generate: Generate,
+        requests: TokenBucket,
+        tokens: TokenBucket,
+        concurrency: int,
+    ):
+        self.name = name
+        self.generate = generate
+        self.requests = requests
+        self.tokens = tokens
+        self.concurrency = concurrency
+        self.stats = ProviderStats()
+
+    async def call(
+        self, system_prompt: str, prompt: str, response_format: Type[BaseModel]
+    ) -> BaseModel:
+        estimate = estimate_tokens(system_prompt + prompt) + OUTPUT_TOKENS_ESTIMATE
+        for attempt in range(MAX_ATTEMPTS):
+            await self.requests.acquire()
+            await self.tokens.acquire(estimate)
+            self.stats.requests += 1
+            self.stats.tokens += estimate
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(
+                    self.generate(system_prompt, prompt, response_format),
+                    REQUEST_TIMEOUT_SECONDS,
+                )
+            except Exception as e:
+                self.stats.seconds += time.perf_counter() - started
+                if status_code(e) == 429:
+                    self.stats.rate_limited += 1
+                if attempt + 1 == MAX_ATTEMPTS or not is_retryable(e):
+                    raise
+                self.stats.retried += 1
+                await asyncio.sleep(retry_delay(e, attempt))
+                continue
+            self.stats.seconds += time.perf_counter() - started
+            # Settles the output estimate against the size of the response
+            actual_output = estimate_tokens(result.model_dump_json())
+            self.tokens.consume(actual_output - OUTPUT_TOKENS_ESTIMATE)
+            self.stats.tokens += actual_output - OUTPUT_TOKENS_ESTIMATE
+            return result
+
+
+def build_providers(names: List[str], concurrency: Optional[int] = None):
+    buckets = {}
+    providers = []
+    for name in names:
+        credential = PROVIDER_LIMITS[name]["credential"]
+        if credential not in buckets:
+            limits = CREDENTIAL_LIMITS[credential]
+            buckets[credential] = (
+                TokenBucket(limits["requests_per_minute"]),
+                TokenBucket(limits["tokens_per_minute"]),
+            )
+        requests, tokens = buckets[credential]
+        providers.append(
+            Provider(
+                name,
+                load_generate(name),
+                requests,
+                tokens,
+                concurrency or PROVIDER_LIMITS[name]["concurrency"],
+            )
+        )
+    return providers
+
+
+# Every provider runs `concurrency` workers that take scenarios from one shared
+# queue, so all providers generate at the same time and a faster provider
+# simply takes more of the work. The queue is fed by claiming `batch_size`
+# scenarios at a time from the store, so several generator processes can drain
+# the same database without generating a scenario twice.
+async def generate_scenarios(
+    system_prompt: str,
+    response_format: Type[BaseModel],
+    providers: List[Provider],
+    scenarios: int,
+    batch_size: Optional[int] = None,
+) -> Dict[str, ProviderStats]:
+    workers = sum(provider.concurrency for provider in providers)
+    batch_size = batch_size or workers
+    pending = asyncio.Queue(maxsize=batch_size)
+    # Completed scenarios waiting to be written. A crash loses at most one
+    # batch of generations, and their leases put those scenarios back in line.
+    completed = []
+    finished = asyncio.Event()
+
+    async def flush():
+        batch = completed[:]
+        completed.clear()
+        stored = await asyncio.to_thread(store.update_scenarios, batch)
+        if stored < len(batch):
+            print(
+                f"Skipped {len(batch) - stored} scenarios whose lease expired "
+                "and was claimed by another worker"
+            )
+
+    async def flush_periodically():
+        while not finished.is_set():
+            try:
+                await asyncio.wait_for(finished.wait(), WRITE_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            await flush()
+
+    async def feed():
+        claimed = 0
+        while claimed < scenarios:
+            batch = await asyncio.to_thread(
+                store.claim_scenarios, min(batch_size, scenarios - claimed)
+            )
+            if not batch:
+                break
+            claimed += len(batch)
+            for index, scenario in enumerate(batch):
+                try:
+                    await pending.put(scenario)
+                except asyncio.CancelledError:
+                    await asyncio.to_thread(store.release_scenarios, batch[index:])
+                    raise
+        if not claimed:
+            print("No more scenarios to generate.")
+        for _ in range(workers):
+            await pending.put(None)
+
+    async def worker(provider: Provider):
+        while True:
+            scenario = await pending.get()
+            if scenario is None:
+                return
+            try:
+                datasets = await provider.call(
+                    system_prompt, f"Scenario: {scenario['scenario']}", response_format
+                )
+            except Exception as e:
+                provider.stats.failed += 1
+                if not await asyncio.to_thread(store.fail_scenario, scenario, str(e)):
+                    print(f"Lease on scenario {scenario['id']} was lost")
+                print(
+                    f"Error generating datasets for scenario {scenario['id']} "
+                    f"with {provider.name}: {e}"
+                )
+                continue
+            provider.stats.succeeded += 1
+            completed.append((scenario, datasets))
+            if len(completed) >= WRITE_BATCH_SIZE:
+                await flush()
+            print(
+                f"Generated datasets for scenario {scenario['id']} "
+                f"with {provider.name}"
+            )
+
+    print(f"Generating up to {scenarios} scenarios with {len(providers)} providers...")
+    started = time.perf_counter()
+    flusher = asyncio.create_task(flush_periodically())
+    try:
+        await asyncio.gather(
+            feed(),
+            *[
+                worker(provider)
+                for provider in providers
+                for _ in range(provider.concurrency)
+            ],
+        )
+    finally:
+        # Scenarios claimed but never started go straight back to pending
+        unstarted = []
+        while not pending.empty():
+            scenario = pending.get_nowait()
+            if scenario is not None:
+                unstarted.append(scenario)
+        store.release_scenarios(unstarted)
+        finished.set()
+        await flusher
+    elapsed = time.perf_counter() - started
+    for provider in providers:
+        print(f"  {provider.name}: {provider.stats.summary(elapsed)}")
+    generated = sum(provider.stats.succeeded for provider in providers)
+    print(
+        f"Completed {generated} scenarios in {elapsed:.1f}s "
+        f"({generated / elapsed * 60:.1f} scenarios/min)."
+    )
+    return {provider.name: provider.stats for provider in providers}
+
+
+# Runs the engine against the mock provider on a throwaway database of
+# placeholder scenarios, for measuring engine overhead and limiter behaviour
+async def benchmark(
+    system_prompt: str,
+    response_format: Type[BaseModel],
+    scenarios: int,
+    concurrency: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> Dict[str, ProviderStats]:
+    db_file = store.DB_FILE
+    with tempfile.TemporaryDirectory() as directory:
+        store.DB_FILE = os.path.join(directory, "benchmark.db")
+        try:
+            store.insert_scenarios(
+                [f"Benchmark scenario {index}" for index in range(scenarios)]
+            )
+            return await generate_scenarios(
+                system_prompt,
+                response_format,
+                build_providers(["mock"], concurrency),
+                scenarios,
+                batch_size,
+            )
+        finally:
+            store.close()
+            store.DB_FILE = db_file
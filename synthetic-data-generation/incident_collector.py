@@ -1,30 +1,58 @@
-from data_generator import DatasetList
-from store import get_all_scenario_datasets
+import argparse
+import json
+from typing import Optional
+
+import requests
+
+from dedup import THRESHOLD as DEDUP_THRESHOLD
+from dedup import add_dedup_arguments, iter_unique_datasets
+
+BULK_INSERT_URL = "http://localhost:8000/incidents/bulk"
+
+
+def iter_incidents(
+    dedup_threshold: Optional[float] = DEDUP_THRESHOLD,
+    dedup_report: Optional[str] = None,
+):
+    for dataset in iter_unique_datasets(dedup_threshold, dedup_report):
+        actions_taken = (
+            "\n".join(dataset.actionsTaken)
+            if isinstance(dataset.actionsTaken, list)
+            else dataset.actionsTaken
+        )
+        yield {
+            "description": dataset.issueDescription,
+            "actions_taken": actions_taken,
+            "rca": dataset.rca,
+            "resolution": dataset.resolution,
+            "status": "CLOSED",
+        }
+
+
+def iter_ndjson_lines(incidents):
+    for incident in incidents:
+        yield (json.dumps(incident) + "\n").encode("utf-8")
 
 
 def main():
-    insert_queries = []
-    datasets_raw = get_all_scenario_datasets()
-    for dataset_raw in datasets_raw:
-        dataset_list = DatasetList.model_validate_json(dataset_raw)
-        for dataset in dataset_list.datasets:
-            issueDescription = dataset.issueDescription.replace("'", "''")
-            actionsTaken = (
-                (
-                    "\n".join(dataset.actionsTaken)
-                    if isinstance(dataset.actionsTaken, list)
-                    else dataset.actionsTaken
-                )
-                .replace("'", "''")
-                .replace('"', "")
-            )
-            rca = dataset.rca.replace("'", "''")
-            resolution = dataset.resolution.replace("'", "''")
-            insert_queries.append(
-                f"INSERT INTO INCIDENT (description, actions_taken, rca, resolution, status) VALUES ('{issueDescription}', '{actionsTaken}', '{rca}', '{resolution}', 'CLOSED');"
-            )
-    with open("../service-now/backend/init.sql", "w") as f:
-        f.write("\n".join(insert_queries))
+    parser = argparse.ArgumentParser(
+        description="Load the generated incidents into the incident API."
+    )
+    add_dedup_arguments(parser)
+    args = parser.parse_args()
+    incidents = iter_incidents(
+        None if args.no_dedup else args.dedup_threshold, args.dedup_report
+    )
+
+    # A generator body is sent with chunked transfer encoding, so incidents
+    # are streamed to the backend without building the whole payload first.
+    response = requests.post(
+        BULK_INSERT_URL,
+        data=iter_ndjson_lines(incidents),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    response.raise_for_status()
+    print(f"Inserted {response.json()['inserted']} incidents.")
 
 
 if __name__ == "__main__":
@@ -2,7 +2,7 @@ from typing import TypeVar, Type
 
 from google import genai
 from google.genai import types
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from pydantic import BaseModel
 
 with open("../secret/copilot_api_key", "r") as file:
@@ -13,6 +13,11 @@ copilot_client = OpenAI(
 with open("../secret/gemini_api_key", "r") as file:
     GEMINI_API_KEY = file.read()
 gemini_client = genai.Client(api_key=GEMINI_API_KEY)
+async_copilot_client = AsyncOpenAI(
+    api_key=COPILOT_API_KEY,
+    base_url="https://models.inference.ai.azure.com",
+    max_retries=0,
+)
 PydanticSchema = TypeVar("PydanticSchema", bound=BaseModel)
 
 
@@ -27,19 +32,63 @@ def extract_json_from_response(response_text):
     return response_text
 
 
+# Request arguments and response parsing are shared by the sync functions and
+# the async variants below, so the two only differ in the client they call
+
+
+def chat_request(model: str, system_prompt: str, prompt: str, response_format) -> dict:
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 1.0,
+        "response_format": response_format,
+    }
+
+
+def openai_request(
+    system_prompt: str, prompt: str, response_format: Type[PydanticSchema]
+) -> dict:
+    return chat_request("gpt-4o", system_prompt, prompt, response_format)
+
+
+def deepseek_request(system_prompt: str, prompt: str) -> dict:
+    return chat_request("deepseek-v3", system_prompt, prompt, {"type": "json_object"})
+
+
+def parse_deepseek(completion, response_format: Type[PydanticSchema]) -> PydanticSchema:
+    response = extract_json_from_response(completion.choices[0].message.content)
+    try:
+        return response_format.model_validate_json(response)
+    except Exception as e:
+        print(f"Error parsing JSON: {e}")
+        print(f"Raw response: {response}")
+        raise e
+
+
+def gemini_request(
+    system_prompt: str, prompt: str, response_format: Type[PydanticSchema]
+) -> dict:
+    return {
+        "model": "gemini-2.0-flash",
+        "contents": prompt,
+        "config": types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=response_format,
+            system_instruction=system_prompt,
+        ),
+    }
+
+
 def generate_openai(
     system_prompt: str,
     prompt: str,
     response_format: Type[PydanticSchema],
 ) -> PydanticSchema:
     completion = copilot_client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=1.0,
-        response_format=response_format,
+        **openai_request(system_prompt, prompt, response_format)
     )
     return completion.choices[0].message.parsed
 
@@ -50,21 +99,9 @@ def generate_deepseek(
     response_format: Type[PydanticSchema],
 ) -> PydanticSchema:
     completion = copilot_client.beta.chat.completions.parse(
-        model="deepseek-v3",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=1.0,
-        response_format={"type": "json_object"},
+        **deepseek_request(system_prompt, prompt)
     )
-    response = extract_json_from_response(completion.choices[0].message.content)
-    try:
-        return response_format.model_validate_json(response)
-    except Exception as e:
-        print(f"Error parsing JSON: {e}")
-        print(f"Raw response: {response}")
-        raise e
+    return parse_deepseek(completion, response_format)
 
 
 def generate_gemini(
@@ -73,12 +110,43 @@ def generate_gemini(
     response_format: Type[PydanticSchema],
 ) -> PydanticSchema:
     response = gemini_client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_schema=response_format,
-            system_instruction=system_prompt,
-        ),
+        **gemini_request(system_prompt, prompt, response_format)
+    )
+    return response.parsed
+
+
+# Async variants for generation_engine.py, which keeps many requests in flight.
+# Retries are left to the engine, so the clients do not retry on their own.
+
+
+async def agenerate_openai(
+    system_prompt: str,
+    prompt: str,
+    response_format: Type[PydanticSchema],
+) -> PydanticSchema:
+    completion = await async_copilot_client.beta.chat.completions.parse(
+        **openai_request(system_prompt, prompt, response_format)
+    )
+    return completion.choices[0].message.parsed
+
+
+async def agenerate_deepseek(
+    system_prompt: str,
+    prompt: str,
+    response_format: Type[PydanticSchema],
+) -> PydanticSchema:
+    completion = await async_copilot_client.beta.chat.completions.parse(
+        **deepseek_request(system_prompt, prompt)
+    )
+    return parse_deepseek(completion, response_format)
+
+
+async def agenerate_gemini(
+    system_prompt: str,
+    prompt: str,
+    response_format: Type[PydanticSchema],
+) -> PydanticSchema:
+    response = await gemini_client.aio.models.generate_content(
+        **gemini_request(system_prompt, prompt, response_format)
     )
     return response.parsed
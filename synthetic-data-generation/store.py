@@ -1,75 +1,258 @@
 import sqlite3
-from typing import List
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
 
 DB_FILE = "telco_incidents.db"
+PAGE_SIZE = 500
 
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute(
+# Scenarios move pending -> in_progress -> done. A claim sets a lease, and a
+# worker that crashes or hangs past it loses the claim, so another worker picks
+# the scenario up again. After MAX_ATTEMPTS claims a scenario is marked failed.
+STATUSES = ("pending", "in_progress", "done", "failed")
+LEASE_SECONDS = 900
+MAX_ATTEMPTS = 3
+# Seconds a connection waits for another worker's write lock
+BUSY_TIMEOUT = 30
+
+# One connection per process, shared by every thread behind a lock. It is
+# opened, switched to WAL and given the schema once, and reopened only when
+# DB_FILE points somewhere else.
+_connection = None
+_connection_file = None
+_lock = threading.RLock()
+
+
+def get_db_connection() -> sqlite3.Connection:
+    global _connection, _connection_file
+    with _lock:
+        if _connection is not None and _connection_file == DB_FILE:
+            return _connection
+        close()
+        conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers, such as an export, run while workers write
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS INCIDENTS (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scenario TEXT NOT NULL,
+            dataset TEXT,
+            generated BOOLEAN DEFAULT 0
+        )
         """
-    CREATE TABLE IF NOT EXISTS INCIDENTS (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        scenario TEXT NOT NULL,
-        dataset TEXT,
-        generated BOOLEAN DEFAULT 0
-    )
-    """
-    )
-    conn.commit()
-    return conn
+        )
+        migrate(cursor)
+        conn.commit()
+        _connection, _connection_file = conn, DB_FILE
+        return conn
 
 
-def insert_scenarios(scenarios: List[str]):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    for scenario in scenarios:
+def close():
+    global _connection, _connection_file
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+        _connection = _connection_file = None
+
+
+# The sqlite3 module runs DDL outside a transaction, so the migration opens
+# one itself: a crash part way through leaves none of the new columns rather
+# than some, which the `status` check below would never finish.
+def migrate(cursor):
+    columns = {row["name"] for row in cursor.execute("PRAGMA table_info(INCIDENTS)")}
+    if "status" in columns:
+        return
+    statuses = ", ".join(f"'{status}'" for status in STATUSES)
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute(
+            "ALTER TABLE INCIDENTS ADD COLUMN status TEXT NOT NULL DEFAULT 'pending' "
+            f"CHECK (status IN ({statuses}))"
+        )
+        cursor.execute("ALTER TABLE INCIDENTS ADD COLUMN lease_expires_at REAL")
+        cursor.execute(
+            "ALTER TABLE INCIDENTS ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+        )
+        cursor.execute("ALTER TABLE INCIDENTS ADD COLUMN last_error TEXT")
+        cursor.execute("UPDATE INCIDENTS SET status = 'done' WHERE generated = 1")
         cursor.execute(
-            f"INSERT INTO INCIDENTS (scenario, generated) VALUES (?, ?)",
-            (scenario, False),
+            "CREATE INDEX IF NOT EXISTS idx_incidents_status "
+            "ON INCIDENTS (status, lease_expires_at, id)"
         )
-    conn.commit()
-    conn.close()
-
-
-def get_scenario_to_generate(order="ASC"):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        f"SELECT * FROM INCIDENTS WHERE generated = 0 ORDER BY ID {order} LIMIT 1"
-    )
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        scenario = dict(row)
-        return scenario
-    return None
-
-
-def update_scenario(scenario, datasets):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    dataset_json = datasets.model_dump_json()
-    cursor.execute(
-        f"UPDATE INCIDENTS SET dataset = ?, generated = 1 WHERE id = ?",
-        (dataset_json, scenario["id"]),
-    )
-    conn.commit()
-    conn.close()
-
-
-def get_all_scenario_datasets(limit: int = 200) -> List[str]:
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        f"SELECT dataset FROM INCIDENTS WHERE dataset IS NOT NULL LIMIT ?", (limit,)
-    )
-    rows = cursor.fetchall()
-    conn.close()
-    datasets = []
-    for row in rows:
-        if row["dataset"]:
-            datasets.append(row["dataset"])
-    return datasets
+        cursor.execute("COMMIT")
+    except BaseException:
+        cursor.execute("ROLLBACK")
+        raise
+
+
+def insert_scenarios(scenarios: List[str]):
+    with _lock:
+        conn = get_db_connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO INCIDENTS (scenario, generated) VALUES (?, 0)",
+                [(scenario,) for scenario in scenarios],
+            )
+
+
+# Claims up to `limit` scenarios for this worker in a single UPDATE, which
+# SQLite runs under its write lock, so concurrent workers never claim the same
+# scenario. Scenarios whose lease expired are claimed again. The returned rows
+# carry the lease_expires_at this claim set, and the writes below only apply
+# while it is unchanged, so a worker whose lease expired and was claimed by
+# another worker can no longer touch the scenario.
+def claim_scenarios(
+    limit: int, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS
+) -> List[dict]:
+    now = time.time()
+    with _lock:
+        conn = get_db_connection()
+        with conn:
+            conn.execute(
+                """
+            UPDATE INCIDENTS SET status = 'failed', lease_expires_at = NULL
+            WHERE status = 'in_progress' AND lease_expires_at < ? AND attempts >= ?
+            """,
+                (now, max_attempts),
+            )
+            rows = conn.execute(
+                """
+            UPDATE INCIDENTS
+            SET status = 'in_progress', lease_expires_at = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM INCIDENTS
+                WHERE status = 'pending'
+                    OR (status = 'in_progress' AND lease_expires_at < ?)
+                ORDER BY id
+                LIMIT ?
+            )
+            RETURNING *
+            """,
+                (now + lease_seconds, now, limit),
+            ).fetchall()
+    return sorted((dict(row) for row in rows), key=lambda row: row["id"])
+
+
+# Stores the datasets of many scenarios in one transaction, so a generator
+# pays for one commit per batch instead of one per scenario. Returns how many
+# were stored, scenarios whose lease was lost are skipped.
+def update_scenarios(results: List[Tuple[dict, object]]) -> int:
+    if not results:
+        return 0
+    with _lock:
+        conn = get_db_connection()
+        with conn:
+            cursor = conn.executemany(
+                """
+            UPDATE INCIDENTS
+            SET dataset = ?, generated = 1, status = 'done', lease_expires_at = NULL
+            WHERE id = ? AND status = 'in_progress' AND lease_expires_at = ?
+            """,
+                [
+                    (
+                        datasets.model_dump_json(),
+                        scenario["id"],
+                        scenario["lease_expires_at"],
+                    )
+                    for scenario, datasets in results
+                ],
+            )
+    return cursor.rowcount
+
+
+# A failed scenario goes back to pending until it has used up its attempts.
+# Returns False when the lease was lost and the scenario left alone.
+def fail_scenario(scenario, error: str, max_attempts: int = MAX_ATTEMPTS) -> bool:
+    with _lock:
+        conn = get_db_connection()
+        with conn:
+            cursor = conn.execute(
+                """
+            UPDATE INCIDENTS
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                lease_expires_at = NULL, last_error = ?
+            WHERE id = ? AND status = 'in_progress' AND lease_expires_at = ?
+            """,
+                (max_attempts, error, scenario["id"], scenario["lease_expires_at"]),
+            )
+    return cursor.rowcount == 1
+
+
+# Returns claimed but unstarted scenarios, without counting the claim as an
+# attempt, so a stopped worker does not leave them waiting for the lease
+def release_scenarios(scenarios: List[dict]):
+    if not scenarios:
+        return
+    with _lock:
+        conn = get_db_connection()
+        with conn:
+            conn.executemany(
+                """
+            UPDATE INCIDENTS
+            SET status = 'pending', lease_expires_at = NULL, attempts = attempts - 1
+            WHERE id = ? AND status = 'in_progress' AND lease_expires_at = ?
+            """,
+                [
+                    (scenario["id"], scenario["lease_expires_at"])
+                    for scenario in scenarios
+                ],
+            )
+
+
+# A separate connection holding one read transaction. Under WAL every query
+# made through it sees the same snapshot of the store, however many scenarios
+# generation workers write in the meantime.
+@contextmanager
+def snapshot() -> Iterator[sqlite3.Connection]:
+    # Creates and migrates the schema before it is read
+    get_db_connection()
+    conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("BEGIN")
+        yield conn
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def generated_page(
+    conn: sqlite3.Connection, last_id: int, page_size: int
+) -> List[sqlite3.Row]:
+    return conn.execute(
+        """
+        SELECT id, dataset FROM INCIDENTS
+        WHERE dataset IS NOT NULL AND id > ?
+        ORDER BY id
+        LIMIT ?
+        """,
+        (last_id, page_size),
+    ).fetchall()
+
+
+# Yields (scenario id, dataset JSON string) for every generated scenario in id
+# order, read through `conn` when given, such as a snapshot. Each page is a
+# separate keyset query, so memory stays flat and every page costs the same
+# however far into the corpus it is.
+def iter_generated_scenarios(
+    page_size: int = PAGE_SIZE, conn: Optional[sqlite3.Connection] = None
+) -> Iterator[Tuple[int, str]]:
+    last_id = 0
+    while True:
+        if conn is None:
+            with _lock:
+                rows = generated_page(get_db_connection(), last_id, page_size)
+        else:
+            rows = generated_page(conn, last_id, page_size)
+        for row in rows:
+            if row["dataset"]:
+                yield row["id"], row["dataset"]
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]